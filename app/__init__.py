@@ -1,21 +1,45 @@
-import os
-import logging 
-from logging.handlers import RotatingFileHandler
 from flask import Flask 
-from config import Config 
-from flask_sqlalchemy import SQLAlchemy 
+from config import Config, DEFAULT_SECRET_KEY
+from app.database import SQLAlchemy
 from flask_migrate import Migrate
+from app.cache import TokenCache, CachedCount, HomeFeedCache
+from app.response_cache import ResponseCache
+from app.listens import ListenAggregator
+from app.metrics import Metrics
+from app.logs import QueuedLogging
+from app.compression import Compression
 
 db = SQLAlchemy()
 migrate = Migrate()
+token_cache = TokenCache()
+catalog_count = CachedCount('CATALOG_COUNT_TTL')
+trending_count = CachedCount('CATALOG_COUNT_TTL')
+response_cache = ResponseCache()
+home_feed_cache = HomeFeedCache()
+listen_aggregator = ListenAggregator()
+metrics = Metrics()
+queued_logging = QueuedLogging()
+compression = Compression()
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    if (app.config.get('ACCESS_TOKEN_FORMAT') == 'signed' and 
+            app.config.get('SECRET_KEY') in (None, '', DEFAULT_SECRET_KEY)):
+        # anyone could sign access tokens with the public default key
+        raise RuntimeError('ACCESS_TOKEN_FORMAT=signed needs SECRET_KEY to be set')
 
     # Extention initialization
     db.init_app(app) 
     migrate.init_app(app, db)
+    token_cache.init_app(app)
+    catalog_count.init_app(app)
+    trending_count.init_app(app)
+    response_cache.init_app(app)
+    home_feed_cache.init_app(app)
+    listen_aggregator.init_app(app)
+    metrics.init_app(app)
+    compression.init_app(app)
 
     # Blueprint registration 
     from app.api import bp as api_bp
@@ -23,14 +47,12 @@ def create_app(config_class=Config):
 
     # app model extention 
 
+    # background maintenance
+    from app.tasks import start_background_tasks
+    start_background_tasks(app)
+
     if not app.debug:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler('logs/api.log', maxBytes=10240, backupCount = 10)
-        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-        app.logger.setLevel(logging.INFO)
+        queued_logging.init_app(app)
         app.logger.info('Starting API')
 
     return app
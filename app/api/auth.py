@@ -2,6 +2,7 @@ from flask import g
 from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth
 from app.models import User, UserToken
 from app.api.errors import error_response, bad_request
+from app.token_signing import is_signed_token
 
 import logging
 log = logging.getLogger('app.api.auth')
@@ -26,6 +27,9 @@ def verify_token(token):
     if hasattr(g, 'token_auth_type') and g.token_auth_type == 'refresh':
         return UserToken.check_token(token, token_type='refresh') if token else None
 
+    if token and is_signed_token(token):
+        return UserToken.check_signed_token(token)
+
     return UserToken.check_token(token) if token else None
 
 @token_auth.error_handler 
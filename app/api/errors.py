@@ -14,6 +14,10 @@ def error_response(status_code, message=None):
 def bad_request(message):
     return error_response(400, message)
 
+@bp.app_errorhandler(400)
+def bad_request_error(error):
+    return bad_request(error.description)
+
 @bp.app_errorhandler(404)
 def not_found_error(error):
     return error_response(404)
@@ -1,11 +1,53 @@
-from flask import jsonify, request, url_for, g
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from flask import (jsonify, request, url_for, g, current_app, Response, 
+                   stream_with_context, abort)
 from functools import wraps
-from app import db
-from app.models import User, MusicItem
+from sqlalchemy.exc import IntegrityError
+from app import (db, catalog_count, trending_count, response_cache, 
+                 listen_aggregator, token_cache, metrics, queued_logging)
+from app.models import (User, MusicItem, Playlist, PlaylistItem, ListenHourlyMusicItem, 
+                        ListenHourlyUser, MUSIC_ITEM_COLUMNS, music_item_row_to_dict, 
+                        PLAYLIST_ITEM_COLUMNS, playlist_item_row_to_dict)
 from app.api import bp 
-from app.api.errors import bad_request
+from app.catalog import export_query, export_music_items
+from app.listens import write_listen_events, listening_stats, top_music_query
+from app.feeds import (HOME_FEED_KEYSET, home_feed_query, 
+                       materialized_home_feed_page, recommended_home_feed_page)
+from app.similarity import similar_music_query
+from app.trending import TRENDING_KEYSET, trending_query
+from app.api.errors import bad_request, error_response
 from app.api.auth import basic_auth, token_auth
 
+# keyset columns for cursor pagination, the trailing id keeps the order total
+MUSIC_SORT_KEYSETS = {
+    'listen_count': (MusicItem.listen_count, MusicItem.id),
+    'pin_count': (MusicItem.pin_count, MusicItem.id),
+    'trending': TRENDING_KEYSET
+}
+
+def include_totals():
+    # ?totals=0 drops total_items/total_pages, saving the count entirely
+    return request.args.get('totals', '1').lower() not in ('0', 'false', 'no')
+
+def music_catalog_count():
+    return catalog_count.get(lambda: MusicItem.query.filter(
+                MusicItem.private.isnot(True)).count())
+
+def json_response(data):
+    # byte for byte what jsonify(data) produces for plain dicts and lists,
+    # without going through the app's JSONEncoder
+    if current_app.config['JSONIFY_PRETTYPRINT_REGULAR'] or current_app.debug:
+        indent, separators = 2, (', ', ': ')
+    else:
+        indent, separators = None, (',', ':')
+    body = json.dumps(data, indent=indent, separators=separators, 
+                      sort_keys=current_app.config['JSON_SORT_KEYS'], 
+                      ensure_ascii=current_app.config['JSON_AS_ASCII'])
+    return current_app.response_class((body + '\n').encode('utf8'), 
+                    mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
 def force_refresh_authentication(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -13,8 +55,74 @@ def force_refresh_authentication(f):
         return f(*args, **kwargs)
     return decorated
 
+def read_replica(f):
+    # listed below login_required, so authentication has already run on the
+    # primary and the user who just wrote keeps reading from it
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        user = token_auth.current_user()
+        db.use_replica(user.id if user else None)
+        return f(*args, **kwargs)
+    return decorated
+
+def conditional(etag, private=True):
+    # answers If-None-Match with a 304 before the view (and its list query)
+    # runs. Tags are weak, item counts inside a page may move without a bump
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            tag = etag()
+            if request.if_none_match.contains_weak(tag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+            return response
+        return decorated
+    return decorator
+
+def catalog_version():
+    # listen and pin counts change constantly, so the catalog has no exact
+    # version. New items bump the response cache generation at once, other
+    # changes may take CATALOG_COUNT_TTL to show, as they do for the totals
+    return '{}.{}'.format(response_cache.generation(), 
+                          int(time.time() // max(catalog_count.ttl, 1)))
+
+def default_list_etag():
+    return 'default-{}'.format(catalog_version())
+
+def user_list_etag(name):
+    def etag():
+        user_id = token_auth.current_user().id
+        return '{}-{}-{}'.format(name, user_id, User.current_list_version(user_id))
+    return etag
+
+def home_list_etag():
+    return '{}-{}'.format(user_list_etag('home')(), catalog_version())
+
+@bp.after_request
+def stick_to_primary_after_write(response):
+    user = token_auth.current_user()
+    if user is not None and db.wrote:
+        db.stick(user.id)
+    return response
+
+def token_response(user_tokens):
+    # read the token strings before commit expires them, otherwise each one
+    # is reloaded with its own SELECT
+    data = {
+        'access_token': user_tokens['access_token'].token, 
+        'refresh_token': user_tokens['refresh_token'].token
+    }
+    db.session.commit()
+    return jsonify(data)
+
 @bp.route('/users/<int:id>', methods=['GET'])
 @token_auth.login_required
+@read_replica
 def get_user(id):
     user = User.query.get_or_404(id)
     return jsonify(user.to_dict())
@@ -36,80 +144,349 @@ def create_user():
     return response
 
 @bp.route('/music/default', methods=['GET'])
+@conditional(default_list_etag, private=False)
+@response_cache.cached
+@read_replica
 def get_default_music_list():
     page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))
+    cursor = request.args.get('cursor')
+    sort = request.args.get('sort', 'listen_count')
+    if sort not in MUSIC_SORT_KEYSETS:
+        return bad_request('sort must be one of: {}'.format(
+                            ', '.join(sorted(MUSIC_SORT_KEYSETS))))
+    keyset = MUSIC_SORT_KEYSETS[sort]
+    totals = include_totals()
+    if sort == 'trending':
+        # precomputed ranks, only items scored by update_trending are listed
+        query = trending_query()
+        total = trending_count.get(query.count) if totals else None
+    else:
+        query = MusicItem.query.filter(MusicItem.private.isnot(True)).order_by(
+                    *[column.desc() for column in keyset])
+        total = music_catalog_count() if totals else None
     data = MusicItem.to_collection_dict(
-                MusicItem.query.order_by(MusicItem.listen_count.desc()), 
-                page, per_page, 'api.get_default_music_list')
-    return jsonify(data)
+                query, page, per_page, 'api.get_default_music_list', 
+                cursor=cursor, keyset=keyset, total=total, 
+                include_totals=totals, columns=MUSIC_ITEM_COLUMNS, 
+                row_to_dict=music_item_row_to_dict, sort=sort)
+    return json_response(data)
     
 @bp.route('/music/home', methods=['GET'])
 @token_auth.login_required
+@read_replica
+@conditional(home_list_etag)
 def get_user_home_music_list():
     user = token_auth.current_user()
-    pinned_music_ids = db.session.query(MusicItem.id).filter(
-                        User.pinned_music).filter(User.id == user.id)
     page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))
+    cursor = request.args.get('cursor')
+    sort = request.args.get('sort')
+    if sort not in (None, 'listen_count', 'recommended'):
+        return bad_request('sort must be one of: listen_count, recommended')
+    if sort == 'recommended' and cursor is not None:
+        return bad_request('sort=recommended only supports page pagination')
+    totals = include_totals()
+    # approximate, the catalog count is cached and may lag by a few seconds
+    total = max(music_catalog_count() - (user.pinned_count or 0), 0) \
+                if totals else None
+    if cursor is not None:
+        items = None
+    elif sort == 'recommended':
+        items = recommended_home_feed_page(user.id, page, per_page, 
+                    current_app.config['HOME_RECOMMENDATIONS'])
+    else:
+        items = materialized_home_feed_page(user.id, page, per_page)
     data = MusicItem.to_collection_dict(
-                MusicItem.query.filter(~MusicItem.id.in_(pinned_music_ids)),
-                page, per_page, 'api.get_user_home_music_list')
-    return jsonify(data)
+                home_feed_query(user.id),
+                page, per_page, 'api.get_user_home_music_list', 
+                cursor=cursor, keyset=HOME_FEED_KEYSET, 
+                total=total, include_totals=totals, items=items, 
+                columns=MUSIC_ITEM_COLUMNS, row_to_dict=music_item_row_to_dict, 
+                sort=sort)
+    return json_response(data)
 
 @bp.route('/music/pinned', methods=['GET'])
 @token_auth.login_required 
+@read_replica
+@conditional(user_list_etag('pinned'))
 def get_pinned_music_list():
     user = token_auth.current_user()
     page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 5, type=int), 10)
+    per_page = max(1, min(request.args.get('per_page', 5, type=int), 10))
+    cursor = request.args.get('cursor')
     data = user.to_collection_dict(
                 user.pinned_music, 
-                page, per_page, 'api.get_pinned_music_list')
-    return jsonify(data)
+                page, per_page, 'api.get_pinned_music_list', 
+                cursor=cursor, keyset=(MusicItem.id,), 
+                total=user.pinned_count, include_totals=include_totals(), 
+                columns=MUSIC_ITEM_COLUMNS, row_to_dict=music_item_row_to_dict)
+    return json_response(data)
 
 @bp.route('/music/pinned/<int:id>', methods=['POST'])
 @token_auth.login_required 
 def pin_music(id):
     user = token_auth.current_user()
-    music_item = MusicItem.query.get_or_404(id)
-    if user.is_pinned(music_item):
+    if not user.pin_music_item(id):
+        # nothing was inserted, look up the item only to pick the error
+        MusicItem.query.filter(MusicItem.id == id, 
+                               MusicItem.visible_to(user.id)).first_or_404()
         return bad_request('Music video is already in pinned list')
-    if music_item.pin_count is None:
-        music_item.pin_count = 1
-    else: 
-        setattr(music_item, 'pin_count', MusicItem.pin_count + 1)
-    db.session.add(music_item)
-    user.pin_music_item(music_item)
     db.session.commit()
+    response_cache.note_change()
     return '', 200
 
 @bp.route('/music/pinned/<int:id>', methods=['DELETE'])
 @token_auth.login_required 
 def unpin_music(id):
     user = token_auth.current_user()
-    music_item = MusicItem.query.get_or_404(id)
-    if user.is_pinned(music_item) is None:
+    if not user.unpin_music_item(id):
+        MusicItem.query.get_or_404(id)
         return bad_request('Music video not found in pinned list')
-    if music_item.pin_count is None:
-        music_item.pin_count = 0
-    else:
-        setattr(music_item, 'pin_count', MusicItem.pin_count - 1)
-    db.session.add(music_item)
-    user.unpin_music_item(music_item)
     db.session.commit()
+    response_cache.note_change()
     return '', 204
 
+def batch_music_ids(ids):
+    # validated, de-duplicated id list or an error message
+    if not isinstance(ids, list) or not ids:
+        return None, 'must include a list of music item ids'
+    if not all(isinstance(id, int) and not isinstance(id, bool) for id in ids):
+        return None, 'music item ids must be integers'
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > current_app.config['MAX_MUSIC_BATCH']:
+        return None, 'at most {} music items per request'.format(
+                        current_app.config['MAX_MUSIC_BATCH'])
+    return ids, None
+
+def batch_results(statuses):
+    return jsonify({'results': [{'id': id, 'status': status} 
+                                for id, status in statuses.items()]})
+
+@bp.route('/music/pinned/batch', methods=['POST'])
+@token_auth.login_required 
+def pin_music_batch():
+    ids, error = batch_music_ids((request.get_json() or {}).get('ids'))
+    if error:
+        return bad_request(error)
+    statuses = token_auth.current_user().pin_music_items(ids)
+    db.session.commit()
+    response_cache.note_change(list(statuses.values()).count('pinned'))
+    return batch_results(statuses)
+
+@bp.route('/music/pinned/batch', methods=['DELETE'])
+@token_auth.login_required 
+def unpin_music_batch():
+    ids, error = batch_music_ids((request.get_json() or {}).get('ids'))
+    if error:
+        return bad_request(error)
+    statuses = token_auth.current_user().unpin_music_items(ids)
+    db.session.commit()
+    response_cache.note_change(list(statuses.values()).count('unpinned'))
+    return batch_results(statuses)
+
+@bp.route('/music/items', methods=['GET'])
+@token_auth.login_required 
+@read_replica
+def get_music_items():
+    try:
+        ids = [int(id) for id in request.args.get('ids', '').split(',') if id]
+    except ValueError:
+        return bad_request('ids must be a comma separated list of integers')
+    ids, error = batch_music_ids(ids)
+    if error:
+        return bad_request(error)
+    user = token_auth.current_user()
+    items = {item.id: item for item in MusicItem.query.filter(
+                MusicItem.id.in_(ids), MusicItem.visible_to(user.id))}
+    return jsonify({
+        'items': [items[id].to_dict() for id in ids if id in items],
+        'missing': [id for id in ids if id not in items]
+    })
+
+@bp.route('/music/<int:id>/similar', methods=['GET'])
+@read_replica
+def get_similar_music(id):
+    limit = min(request.args.get('limit', 10, type=int), 
+                current_app.config['SIMILARITY_TOP_K'])
+    rows = similar_music_query(id).with_entities(
+                *MUSIC_ITEM_COLUMNS).limit(max(limit, 0)).all()
+    if not rows:
+        music_item = MusicItem.query.get_or_404(id)
+        if music_item.private:
+            abort(404)
+    return json_response({'items': [music_item_row_to_dict(row) for row in rows]})
+
+@bp.route('/music/<int:id>/listen', methods=['POST'])
+@token_auth.login_required
+def record_listen(id):
+    if id < 1:
+        abort(404)
+    # buffered, the item's listen_count is updated on the next flush
+    listen_aggregator.record(id)
+    return '', 202
+
+@bp.route('/music/listens', methods=['POST'])
+@token_auth.login_required
+def record_listens():
+    data = request.get_json() or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        return bad_request('must include a list of music item ids')
+    if len(ids) > current_app.config['MAX_LISTEN_BATCH']:
+        return bad_request('at most {} listens per request'.format(
+                            current_app.config['MAX_LISTEN_BATCH']))
+    if not all(isinstance(id, int) and not isinstance(id, bool) and id > 0 
+               for id in ids):
+        return bad_request('music item ids must be positive integers')
+    counts = {}
+    for id in ids:
+        counts[id] = counts.get(id, 0) + 1
+    listen_aggregator.record_many(counts)
+    response = jsonify({'accepted': len(ids)})
+    response.status_code = 202
+    return response
+
+def parse_timestamp(value):
+    # ISO 8601 as a naive UTC datetime, values without an offset are UTC.
+    # None when it does not parse
+    if not isinstance(value, str):
+        return None
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+@bp.route('/music/listens/events', methods=['POST'])
+@token_auth.login_required
+def record_listen_events():
+    events = (request.get_json() or {}).get('events')
+    if not isinstance(events, list) or not events:
+        return bad_request('must include a list of listen events')
+    if len(events) > current_app.config['MAX_LISTEN_BATCH']:
+        return bad_request('at most {} listen events per request'.format(
+                            current_app.config['MAX_LISTEN_BATCH']))
+    # a little clock skew is tolerated, later start times are client bugs
+    latest = datetime.utcnow() + timedelta(minutes=5)
+    parsed = []
+    for index, event in enumerate(events):
+        event = event if isinstance(event, dict) else {}
+        music_item_id, duration = event.get('music_item_id'), event.get('duration')
+        started_at = parse_timestamp(event.get('started_at'))
+        if (not isinstance(music_item_id, int) or isinstance(music_item_id, bool) 
+                or not isinstance(duration, int) or isinstance(duration, bool) 
+                or not 0 <= duration <= current_app.config['MAX_LISTEN_DURATION'] 
+                or started_at is None or started_at > latest):
+            return bad_request('event {} needs a music_item_id, a started_at '
+                               'timestamp and a duration in seconds'.format(index))
+        parsed.append((music_item_id, started_at, duration))
+    user = token_auth.current_user()
+    visible = {id for id, in db.session.query(MusicItem.id).filter(
+                MusicItem.id.in_({event[0] for event in parsed}), 
+                MusicItem.visible_to(user.id))}
+    rows, rejected, counts = [], [], {}
+    for index, (music_item_id, started_at, duration) in enumerate(parsed):
+        if music_item_id not in visible:
+            rejected.append(index)
+            continue
+        rows.append({'user_id': user.id, 'music_item_id': music_item_id, 
+                     'started_at': started_at, 'duration': duration})
+        counts[music_item_id] = counts.get(music_item_id, 0) + 1
+    write_listen_events(rows)
+    db.session.commit()
+    # every event is also a play of the item. record_many never raises, so
+    # a batch that is already committed cannot turn into a 500 and a retry
+    if counts:
+        listen_aggregator.record_many(counts)
+    response = jsonify({'accepted': len(rows), 'rejected': rejected})
+    response.status_code = 202
+    return response
+
+def stats_range():
+    # (since, until, bucket, error message) from the query string, the last
+    # seven days by day by default
+    until = datetime.utcnow()
+    if 'until' in request.args:
+        until = parse_timestamp(request.args['until'])
+    since = until - timedelta(days=7) if until is not None else None
+    if 'since' in request.args:
+        since = parse_timestamp(request.args['since'])
+    bucket = request.args.get('bucket', 'day')
+    if since is None or until is None:
+        return None, None, None, 'since and until must be ISO 8601 timestamps'
+    if since >= until:
+        return None, None, None, 'since must be before until'
+    if until - since > timedelta(days=current_app.config['MAX_STATS_DAYS']):
+        return None, None, None, 'at most {} days of stats per request'.format(
+                                    current_app.config['MAX_STATS_DAYS'])
+    if bucket not in ('hour', 'day'):
+        return None, None, None, 'bucket must be one of: hour, day'
+    return since, until, bucket, None
+
+@bp.route('/stats/listening', methods=['GET'])
+@token_auth.login_required
+@read_replica
+def get_listening_stats():
+    since, until, bucket, error = stats_range()
+    if error:
+        return bad_request(error)
+    return jsonify(listening_stats(ListenHourlyUser, ListenHourlyUser.user_id, 
+                                   token_auth.current_user().id, 
+                                   since, until, bucket))
+
+@bp.route('/stats/music/<int:id>', methods=['GET'])
+@read_replica
+def get_music_stats(id):
+    since, until, bucket, error = stats_range()
+    if error:
+        return bad_request(error)
+    music_item = MusicItem.query.get_or_404(id)
+    if music_item.private:
+        abort(404)
+    data = listening_stats(ListenHourlyMusicItem, ListenHourlyMusicItem.music_item_id, 
+                           id, since, until, bucket)
+    data['music_item'] = music_item.to_dict()
+    return jsonify(data)
+
+@bp.route('/stats/music/top', methods=['GET'])
+@read_replica
+def get_top_music_stats():
+    since, until, _, error = stats_range()
+    if error:
+        return bad_request(error)
+    limit = max(min(request.args.get('limit', 10, type=int), 100), 0)
+    top = top_music_query(since, until).limit(limit).all()
+    items = {row[0]: music_item_row_to_dict(row) 
+             for row in db.session.query(*MUSIC_ITEM_COLUMNS).filter(
+                MusicItem.id.in_([music_item_id for music_item_id, _, _ in top]))}
+    return jsonify({
+        'since': since.isoformat() + 'Z',
+        'until': until.isoformat() + 'Z',
+        'items': [{'music_item': items[music_item_id], 'listens': listens, 
+                   'seconds': seconds} for music_item_id, listens, seconds in top]
+    })
+
 @bp.route('/music/private', methods=['GET'])
 @token_auth.login_required 
+@read_replica
+@conditional(user_list_etag('private'))
 def get_private_music_list():
     user = token_auth.current_user()
     page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 5, type=int), 10)
+    per_page = max(1, min(request.args.get('per_page', 5, type=int), 10))
+    cursor = request.args.get('cursor')
     data = user.to_collection_dict(
                 user.private_music, 
-                page, per_page, 'api.get_private_music_list')
-    return jsonify(data)
+                page, per_page, 'api.get_private_music_list', 
+                cursor=cursor, keyset=(MusicItem.id,), 
+                total=user.private_count, include_totals=include_totals(), 
+                columns=MUSIC_ITEM_COLUMNS, row_to_dict=music_item_row_to_dict)
+    return json_response(data)
 
 @bp.route('/music/private', methods=['POST'])
 @token_auth.login_required
@@ -125,11 +502,15 @@ def create_music_item():
             return bad_request('Music video already publicly avaliable')
         if user.is_in_private_list(music_item): 
             return bad_request('Music video is already in private list')
-    if music_item is None:
+    new_item = music_item is None
+    if new_item:
         music_item = MusicItem()
         music_item.from_dict(data, private=True)
     user.create_private_music_item(music_item)
     db.session.commit()
+    if new_item:
+        catalog_count.invalidate()
+        response_cache.invalidate()
     return '', 201
 
 @bp.route('/music/private/<int:id>', methods=['DELETE'])
@@ -143,37 +524,232 @@ def remove_from_private_music_list(id):
     db.session.commit()
     return '', 200
 
+def user_playlist_or_404(id, for_update=False):
+    query = Playlist.query.filter_by(id=id, user_id=token_auth.current_user().id)
+    if for_update:
+        # serializes writers of one playlist where the database supports it
+        query = query.with_for_update()
+    return query.first_or_404()
+
+def playlist_name(data):
+    name = data.get('name')
+    if not isinstance(name, str) or not name.strip():
+        return None, 'must include a playlist name'
+    if len(name) > Playlist.name.type.length:
+        return None, 'playlist names are at most {} characters'.format(
+                        Playlist.name.type.length)
+    return name.strip(), None
+
+def playlist_position(data):
+    # (before, after) playlist item ids or an error message
+    before, after = data.get('before'), data.get('after')
+    if before is not None and after is not None:
+        return None, None, 'give either before or after, not both'
+    for id in (before, after):
+        if id is not None and (not isinstance(id, int) or isinstance(id, bool)):
+            return None, None, 'before and after must be playlist item ids'
+    return before, after, None
+
+def playlist_conflict():
+    # a concurrent write took the same rank, the client can simply retry
+    db.session.rollback()
+    return error_response(409, 'Playlist changed concurrently, please retry')
+
+@bp.route('/playlists', methods=['GET'])
+@token_auth.login_required
+@read_replica
+def get_playlists():
+    user = token_auth.current_user()
+    page = request.args.get('page', 1, type=int)
+    per_page = max(1, min(request.args.get('per_page', 10, type=int), 50))
+    data = Playlist.to_collection_dict(
+                user.playlists.order_by(Playlist.id.desc()), 
+                page, per_page, 'api.get_playlists', 
+                cursor=request.args.get('cursor'), keyset=(Playlist.id,), 
+                include_totals=include_totals())
+    return jsonify(data)
+
+@bp.route('/playlists', methods=['POST'])
+@token_auth.login_required
+def create_playlist():
+    name, error = playlist_name(request.get_json() or {})
+    if error:
+        return bad_request(error)
+    playlist = Playlist(user_id=token_auth.current_user().id, name=name)
+    db.session.add(playlist)
+    db.session.commit()
+    response = jsonify(playlist.to_dict())
+    response.status_code = 201
+    response.headers['Location'] = url_for('api.get_playlist', id=playlist.id)
+    return response
+
+@bp.route('/playlists/<int:id>', methods=['GET'])
+@token_auth.login_required
+@read_replica
+def get_playlist(id):
+    return jsonify(user_playlist_or_404(id).to_dict())
+
+@bp.route('/playlists/<int:id>', methods=['PUT'])
+@token_auth.login_required
+def update_playlist(id):
+    name, error = playlist_name(request.get_json() or {})
+    if error:
+        return bad_request(error)
+    playlist = user_playlist_or_404(id)
+    playlist.name = name
+    playlist.updated_at = datetime.utcnow()
+    db.session.commit()
+    return jsonify(playlist.to_dict())
+
+@bp.route('/playlists/<int:id>', methods=['DELETE'])
+@token_auth.login_required
+def delete_playlist(id):
+    playlist = user_playlist_or_404(id, for_update=True)
+    PlaylistItem.query.filter_by(playlist_id=playlist.id).delete(
+            synchronize_session=False)
+    db.session.delete(playlist)
+    db.session.commit()
+    return '', 204
+
+@bp.route('/playlists/<int:id>/items', methods=['GET'])
+@token_auth.login_required
+@read_replica
+def get_playlist_items(id):
+    playlist = user_playlist_or_404(id)
+    page = request.args.get('page', 1, type=int)
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 50))
+    query = PlaylistItem.query.join(
+                MusicItem, MusicItem.id == PlaylistItem.music_item_id).filter(
+                    PlaylistItem.playlist_id == playlist.id).order_by(
+                        PlaylistItem.rank)
+    data = Playlist.to_collection_dict(
+                query, page, per_page, 'api.get_playlist_items', 
+                cursor=request.args.get('cursor'), keyset=(PlaylistItem.rank,), 
+                ascending=True, total=playlist.item_count, 
+                include_totals=include_totals(), columns=PLAYLIST_ITEM_COLUMNS, 
+                row_to_dict=playlist_item_row_to_dict, id=playlist.id)
+    return json_response(data)
+
+@bp.route('/playlists/<int:id>/items', methods=['POST'])
+@token_auth.login_required
+def add_playlist_item(id):
+    data = request.get_json() or {}
+    music_item_id = data.get('music_item_id')
+    if not isinstance(music_item_id, int) or isinstance(music_item_id, bool):
+        return bad_request('must include a music item id')
+    before, after, error = playlist_position(data)
+    if error:
+        return bad_request(error)
+    user = token_auth.current_user()
+    playlist = user_playlist_or_404(id, for_update=True)
+    if (playlist.item_count or 0) >= current_app.config['MAX_PLAYLIST_ITEMS']:
+        return bad_request('Playlists hold at most {} items'.format(
+                            current_app.config['MAX_PLAYLIST_ITEMS']))
+    music_item = MusicItem.query.filter(MusicItem.id == music_item_id, 
+                                        MusicItem.visible_to(user.id)).first()
+    if music_item is None:
+        return bad_request('Music video not found')
+    item = playlist.add_item(music_item.id, before=before, after=after)
+    if item is None:
+        return bad_request('Playlist item to place it next to not found')
+    try:
+        db.session.flush()
+    except IntegrityError:
+        return playlist_conflict()
+    data = {'id': item.id, 'rank': item.rank, 'music_item': music_item.to_dict()}
+    db.session.commit()
+    response = jsonify(data)
+    response.status_code = 201
+    return response
+
+@bp.route('/playlists/<int:id>/items/<int:item_id>', methods=['PATCH'])
+@token_auth.login_required
+def move_playlist_item(id, item_id):
+    before, after, error = playlist_position(request.get_json() or {})
+    if error:
+        return bad_request(error)
+    if before is None and after is None:
+        return bad_request('must include before or after')
+    if item_id in (before, after):
+        return bad_request('Cannot place a playlist item next to itself')
+    playlist = user_playlist_or_404(id, for_update=True)
+    item = PlaylistItem.query.filter_by(id=item_id, 
+                                        playlist_id=playlist.id).first_or_404()
+    if not playlist.move_item(item, before=before, after=after):
+        return bad_request('Playlist item to place it next to not found')
+    try:
+        db.session.flush()
+    except IntegrityError:
+        return playlist_conflict()
+    data = item.to_dict()
+    db.session.commit()
+    return jsonify(data)
+
+@bp.route('/playlists/<int:id>/items/<int:item_id>', methods=['DELETE'])
+@token_auth.login_required
+def remove_playlist_item(id, item_id):
+    playlist = user_playlist_or_404(id, for_update=True)
+    item = PlaylistItem.query.filter_by(id=item_id, 
+                                        playlist_id=playlist.id).first_or_404()
+    playlist.remove_item(item)
+    db.session.commit()
+    return '', 204
+
+
+@bp.route('/export/music', methods=['GET'])
+@token_auth.login_required
+@read_replica
+def export_music_catalog():
+    return ndjson_response(export_query('catalog'))
+
+@bp.route('/export/music/pinned', methods=['GET'])
+@token_auth.login_required
+@read_replica
+def export_pinned_music():
+    return ndjson_response(export_query('pinned', token_auth.current_user().id))
+
+@bp.route('/export/music/private', methods=['GET'])
+@token_auth.login_required
+@read_replica
+def export_private_music():
+    return ndjson_response(export_query('private', token_auth.current_user().id))
+
+def ndjson_response(query):
+    # streamed as it is read, the request context (and its session) stays
+    # alive until the generator is exhausted
+    return Response(stream_with_context(export_music_items(query)), 
+                    mimetype='application/x-ndjson')
+
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    token_cache_stats = token_cache.stats()
+    return Response(metrics.render({
+            'token_cache_hits_total': token_cache_stats['hits'],
+            'token_cache_misses_total': token_cache_stats['misses'],
+            'token_cache_entries': token_cache_stats['size'],
+            'listen_buffer_pending': listen_aggregator.pending(),
+            'listen_buffer_dropped_total': listen_aggregator.dropped,
+            'log_records_dropped_total': queued_logging.dropped
+        }), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 
 @bp.route('/tokens', methods=['POST'])
 @basic_auth.login_required
 def get_user_tokens():
     user_tokens = basic_auth.current_user().get_user_tokens()
-    access_token = user_tokens['access_token']
-    refresh_token = user_tokens['refresh_token']
-    db.session.commit()
-    return jsonify({
-        'access_token': access_token.token, 
-        'refresh_token': refresh_token.token
-    })
+    return token_response(user_tokens)
 
 @bp.route('/tokens/refresh', methods=['POST'])
 @force_refresh_authentication
 @token_auth.login_required
 def refresh_tokens():
     user_tokens = basic_auth.current_user().get_user_tokens(full_refresh=True)
-    access_token = user_tokens['access_token']
-    refresh_token = user_tokens['refresh_token']
-    db.session.commit()
-    return jsonify({
-        'access_token': access_token.token, 
-        'refresh_token': refresh_token.token
-    })
+    return token_response(user_tokens)
 
 @bp.route('/tokens', methods=['DELETE'])
 @token_auth.login_required
 def revoke_user_token():
-    user_tokens = token_auth.current_user().get_user_tokens()
-    user_tokens['access_token'].revoke_token()
-    user_tokens['refresh_token'].revoke_token()
+    token_auth.current_user().revoke_user_tokens()
     db.session.commit()
     return '', 204
\ No newline at end of file
@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class TokenCache(object):
+    """Bounded LRU cache of verified tokens.
+
+    Entries are keyed by ``(token, token_type)`` and hold a detached snapshot
+    of the owning user so that a cache hit never touches the database. Each
+    entry lives for at most ``TOKEN_CACHE_TTL`` seconds and never past the
+    token's own expiration.
+    """
+
+    def __init__(self, app=None):
+        self.max_size = 1024
+        self.ttl = 60
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_size = app.config.get('TOKEN_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('TOKEN_CACHE_TTL', self.ttl)
+        self.clear()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, token, token_type):
+        key = (token, token_type)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return user
+
+    def set(self, token, token_type, user, expiration):
+        if not self.enabled:
+            return
+        # expiration is a naive utc datetime, matching UserToken.expiration
+        token_expires_at = (expiration - _EPOCH).total_seconds()
+        expires_at = min(time.time() + self.ttl, token_expires_at)
+        key = (token, token_type)
+        with self._lock:
+            self._entries[key] = (expires_at, user)
+            self._entries.move_to_end(key)
+            self._user_keys.setdefault(user.id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, token, token_type):
+        with self._lock:
+            self._remove((token, token_type))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[1].id
+        keys = self._user_keys.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[user_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+
+class CachedCount(object):
+    """A single count that is recomputed at most every ``ttl`` seconds.
+
+    Used for totals that are expensive to COUNT on every request and where
+    being a few seconds behind is acceptable.
+    """
+
+    def __init__(self, config_key, ttl=30):
+        self.config_key = config_key
+        self.ttl = ttl
+        self._value = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get(self.config_key, self.ttl)
+        self.invalidate()
+
+    def get(self, loader):
+        now = time.time()
+        if self._value is not None and self._expires_at > now:
+            return self._value
+        with self._lock:
+            if self._value is None or self._expires_at <= now:
+                self._value = loader()
+                self._expires_at = now + self.ttl
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._expires_at = 0
+
+
+class HomeFeedCache(object):
+    """Per-user materialized head of the home feed.
+
+    Holds the ids of the first ``depth`` feed items for up to ``max_users``
+    users so pages inside that window are served by primary key lookups
+    instead of re-running the feed query. Entries are dropped whenever the
+    user's pinned or private list changes and otherwise live for ``ttl``
+    seconds. A ttl of 0 disables the cache.
+    """
+
+    def __init__(self):
+        self.max_users = 1024
+        self.depth = 200
+        self.ttl = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_users = app.config.get('HOME_FEED_CACHE_SIZE', self.max_users)
+        self.depth = app.config.get('HOME_FEED_CACHE_DEPTH', self.depth)
+        self.ttl = app.config.get('HOME_FEED_CACHE_TTL', self.ttl)
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_users > 0 and self.depth > 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= time.time():
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, ids):
+        with self._lock:
+            self._entries[user_id] = (time.time() + self.ttl, ids)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
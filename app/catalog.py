@@ -0,0 +1,155 @@
+import csv
+import json
+import time
+from itertools import islice
+from app import db, catalog_count, response_cache
+from app.dialects import insert_ignore, execute_insert_ignore
+from app.models import (MusicItem, MusicTypeEnum, User, MUSIC_ITEM_COLUMNS, 
+                        music_item_row_to_dict)
+
+RESOURCE_TYPES = set(resource_type.name for resource_type in MusicTypeEnum)
+
+
+def read_music_rows(path, format=None):
+    """Yields catalog rows from a JSONL or CSV file one at a time.
+
+    Each row needs ``resource_type`` and ``resource_id``; ``listen_count``
+    and ``private`` are optional. Rows that cannot be used are yielded as
+    None so the caller can count them.
+    """
+    format = format or ('csv' if path.endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf8') as f:
+        if format == 'csv':
+            records = csv.DictReader(f)
+        elif format == 'jsonl':
+            records = (_json_record(line) for line in f if line.strip())
+        else:
+            raise ValueError('Unknown import format {}'.format(format))
+        for record in records:
+            yield _music_row(record)
+
+
+def _json_record(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def _music_row(record):
+    if not isinstance(record, dict):
+        return None
+    resource_type = record.get('resource_type')
+    resource_id = record.get('resource_id')
+    # SoundCloud style ids come through JSON as integers
+    if isinstance(resource_id, int) and not isinstance(resource_id, bool):
+        resource_id = str(resource_id)
+    if resource_type not in RESOURCE_TYPES or \
+            not isinstance(resource_id, str) or not resource_id or \
+            len(resource_id) > 48:
+        return None
+    try:
+        listen_count = int(record['listen_count']) \
+            if record.get('listen_count') not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+    if listen_count is not None and listen_count < 0:
+        return None
+    # None when absent, so an update import leaves the stored flag alone
+    private = record.get('private')
+    if isinstance(private, str):
+        private = private.strip().lower() in ('1', 'true', 'yes') \
+            if private.strip() else None
+    return {
+        'resource_type': resource_type,
+        'resource_id': resource_id,
+        'listen_count': listen_count,
+        'private': bool(private) if private is not None else None
+    }
+
+
+def import_music_items(rows, chunk_size=1000, on_conflict='skip', 
+                       progress=None):
+    """Bulk loads music items from an iterable of rows in chunks.
+
+    Each chunk is written in its own transaction with Core executemany
+    statements, so memory stays flat however large the input is. Rows that
+    already exist on (resource_type, resource_id) are skipped, or with
+    ``on_conflict='update'`` have their listen_count and private flag
+    overwritten where the row gives them. ``progress`` is called with the running stats after every
+    chunk. Returns the final stats.
+    """
+    if on_conflict not in ('skip', 'update'):
+        raise ValueError('on_conflict must be skip or update')
+    music_item = MusicItem.__table__
+    update = music_item.update().where(db.and_(
+            music_item.c.resource_type == db.bindparam('match_type'),
+            music_item.c.resource_id == db.bindparam('match_id'))).values(
+                listen_count=db.func.coalesce(db.bindparam('new_listen_count'), 
+                                              music_item.c.listen_count),
+                private=db.func.coalesce(db.bindparam('new_private'), 
+                                         music_item.c.private))
+    stats = {'read': 0, 'invalid': 0, 'inserted': 0, 'updated': 0, 
+             'skipped': 0, 'elapsed': 0.0}
+    start = time.time()
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        stats['read'] += len(chunk)
+        valid = [row for row in chunk if row is not None]
+        stats['invalid'] += len(chunk) - len(valid)
+        if valid:
+            inserts = [dict(row, listen_count=row['listen_count'] or 0, 
+                            private=bool(row['private'])) for row in valid]
+            with db.engine.begin() as connection:
+                updated = 0
+                if on_conflict == 'update':
+                    updated = connection.execute(update, [{
+                            'match_type': row['resource_type'],
+                            'match_id': row['resource_id'],
+                            'new_listen_count': row['listen_count'],
+                            'new_private': row['private']
+                        } for row in valid]).rowcount
+                inserted = execute_insert_ignore(
+                        connection, insert_ignore(music_item, connection), inserts)
+            stats['inserted'] += inserted
+            stats['updated'] += updated
+            stats['skipped'] += len(valid) - inserted - updated
+        stats['elapsed'] = time.time() - start
+        if progress is not None:
+            progress(stats)
+    stats['elapsed'] = time.time() - start
+    if stats['inserted'] or stats['updated']:
+        catalog_count.invalidate()
+        response_cache.invalidate()
+    return stats
+
+
+def export_query(list_name='catalog', user_id=None):
+    """Query for one of the exportable lists: the public catalog or a
+    user's pinned or private music."""
+    if list_name == 'catalog':
+        query = MusicItem.query.filter(MusicItem.private.isnot(True))
+    elif list_name in ('pinned', 'private'):
+        user = User.query.get(user_id)
+        if user is None:
+            raise ValueError('Unknown user {}'.format(user_id))
+        query = getattr(user, list_name + '_music')
+    else:
+        raise ValueError('Unknown list {}'.format(list_name))
+    return query.order_by(MusicItem.id)
+
+
+def export_music_items(query, batch_size=1000):
+    """Yields one NDJSON line per music item.
+
+    Rows are fetched ``batch_size`` at a time through a server side cursor
+    where the driver supports one, so neither the rows nor the output are
+    ever held in memory as a whole.
+    """
+    query = query.with_entities(*MUSIC_ITEM_COLUMNS).execution_options(
+                stream_results=True).yield_per(batch_size)
+    for row in query:
+        yield json.dumps(music_item_row_to_dict(row), separators=(',', ':')) + '\n'
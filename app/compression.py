@@ -0,0 +1,75 @@
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain')
+
+
+class Compression(object):
+    """Compresses responses of at least ``COMPRESSION_MIN_SIZE`` bytes with
+    brotli (when installed) or gzip, whichever the client prefers in
+    ``Accept-Encoding``.
+
+    Responses served by the response cache are compressed there instead, once
+    per encoding, and the variant is cached next to the plain body. Streamed
+    responses are left alone.
+    """
+
+    def __init__(self):
+        self.min_size = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 5
+
+    def init_app(self, app):
+        self.min_size = app.config.get('COMPRESSION_MIN_SIZE', self.min_size)
+        self.gzip_level = app.config.get('COMPRESSION_GZIP_LEVEL', self.gzip_level)
+        self.brotli_quality = app.config.get('COMPRESSION_BROTLI_QUALITY',
+                                             self.brotli_quality)
+        app.extensions['compression'] = self
+        if self.min_size > 0:
+            app.after_request(self._after_request)
+
+    @property
+    def enabled(self):
+        return self.min_size > 0
+
+    @property
+    def encodings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def negotiate(self, response):
+        """The encoding to send ``response`` in, or None to leave it as is."""
+        if (not self.enabled or response.status_code != 200
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return None
+        response.vary.add('Accept-Encoding')
+        if response.calculate_content_length() < self.min_size:
+            return None
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = request.accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level)
+
+    def apply(self, response, data, encoding):
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+
+    def _after_request(self, response):
+        encoding = self.negotiate(response)
+        if encoding is not None:
+            self.apply(response, self.compress(response.get_data(), encoding),
+                       encoding)
+        return response
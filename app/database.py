@@ -0,0 +1,216 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import g, has_app_context
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+
+def sqlite_pragmas(config):
+    """PRAGMA statements run on every new SQLite connection, settings that
+    are empty or 0 are left at SQLite's default."""
+    pragmas = []
+    if config.get('SQLITE_JOURNAL_MODE'):
+        pragmas.append('PRAGMA journal_mode={}'.format(config['SQLITE_JOURNAL_MODE']))
+    if config.get('SQLITE_SYNCHRONOUS'):
+        pragmas.append('PRAGMA synchronous={}'.format(config['SQLITE_SYNCHRONOUS']))
+    if config.get('SQLITE_BUSY_TIMEOUT'):
+        pragmas.append('PRAGMA busy_timeout={:d}'.format(config['SQLITE_BUSY_TIMEOUT']))
+    if config.get('SQLITE_MMAP_SIZE'):
+        pragmas.append('PRAGMA mmap_size={:d}'.format(config['SQLITE_MMAP_SIZE']))
+    if config.get('SQLITE_CACHE_SIZE'):
+        # negative cache_size is in KiB rather than pages
+        pragmas.append('PRAGMA cache_size=-{:d}'.format(config['SQLITE_CACHE_SIZE']))
+    return pragmas
+
+
+class MemorySticky(object):
+    """Per-process sticky windows, bounded to ``max_users`` entries."""
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self._until = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, user_id, until):
+        with self._lock:
+            self._until[user_id] = until
+            self._until.move_to_end(user_id)
+            while len(self._until) > self.max_users:
+                self._until.popitem(last=False)
+
+    def get(self, user_id, now):
+        with self._lock:
+            until = self._until.get(user_id)
+            if until is not None and until <= now:
+                del self._until[user_id]
+                return None
+            return until
+
+
+class SQLiteSticky(object):
+    """Sticky windows in a local SQLite file, so every worker process on a
+    host sees the writes made through the others."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._connection().execute('CREATE TABLE IF NOT EXISTS replica_sticky ('
+                                   'user_id INTEGER PRIMARY KEY, until REAL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def set(self, user_id, until):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO replica_sticky (user_id, until) '
+                     'VALUES (?, ?)', (user_id, until))
+        # expired windows are harmless, trim them now and then
+        self._writes += 1
+        if self._writes % 128 == 0:
+            conn.execute('DELETE FROM replica_sticky WHERE until <= ?', (time.time(),))
+
+    def get(self, user_id, now):
+        row = self._connection().execute(
+                'SELECT until FROM replica_sticky WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        return row[0] if row is not None and row[0] > now else None
+
+
+class RoutingSession(SignallingSession):
+    """Session that reads from a replica while the request has opted in
+    through ``SQLAlchemy.use_replica``. Flushes and INSERT/UPDATE/DELETE
+    statements always go to the primary, and once the session has written
+    every later read does too so it sees its own changes."""
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+        elif not self.info.get('wrote') and has_app_context():
+            bind_key = g.get('replica_bind')
+            if bind_key is not None and (mapper is None or 
+                    mapper.persist_selectable.info.get('bind_key') is None):
+                return get_state(self.app).db.get_engine(self.app, bind=bind_key)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    """Flask-SQLAlchemy with pool settings taken from the ``DATABASE_POOL_*``
+    config keys and connection pragmas for SQLite.
+
+    ``REPLICA_DATABASE_URIS`` are registered as ``replica<n>`` binds. Requests
+    that call ``use_replica`` read from one of them unless the user wrote
+    within the last ``REPLICA_STICKY_SECONDS``, see ``stick``. Those windows
+    are kept per ``REPLICA_STICKY_BACKEND``.
+
+    Flask-SQLAlchemy gives file based SQLite a NullPool, so each checkout
+    reopens the file and would have to re-run the pragmas. When
+    ``DATABASE_POOL_SIZE`` is set SQLite gets a QueuePool like any other
+    database. Anything in ``SQLALCHEMY_ENGINE_OPTIONS`` still takes priority.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SQLAlchemy, self).__init__(*args, **kwargs)
+        self.sticky_seconds = 0
+        self.max_sticky_users = 10000
+        self._sticky = None
+
+    def init_app(self, app):
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        replica_binds = []
+        for index, uri in enumerate(app.config.get('REPLICA_DATABASE_URIS') or ()):
+            bind_key = 'replica{}'.format(index)
+            binds[bind_key] = uri
+            replica_binds.append(bind_key)
+        if replica_binds:
+            app.config['SQLALCHEMY_BINDS'] = binds
+        app.config['REPLICA_BINDS'] = replica_binds
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+        self._sticky = None
+        if replica_binds and self.sticky_seconds:
+            backend = app.config.get('REPLICA_STICKY_BACKEND', 'memory')
+            if backend == 'sqlite':
+                self._sticky = SQLiteSticky(app.config['REPLICA_STICKY_PATH'])
+            elif backend == 'memory':
+                self._sticky = MemorySticky(self.max_sticky_users)
+            else:
+                raise ValueError('Unknown REPLICA_STICKY_BACKEND {}'.format(backend))
+        super(SQLAlchemy, self).init_app(app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def use_replica(self, user_id=None):
+        """Send the rest of this request's reads to a replica, if any are
+        configured and ``user_id`` has not written recently."""
+        replica_binds = self.get_app().config['REPLICA_BINDS']
+        if replica_binds and not self.is_sticky(user_id):
+            g.replica_bind = random.choice(replica_binds)
+
+    @property
+    def wrote(self):
+        return self.session.registry.has() and \
+            self.session().info.get('wrote', False)
+
+    def stick(self, user_id):
+        """Pin ``user_id``'s reads to the primary for ``sticky_seconds`` so
+        they see their own writes while replicas catch up. Does nothing
+        without replicas."""
+        if self._sticky is not None:
+            self._sticky.set(user_id, time.time() + self.sticky_seconds)
+
+    def is_sticky(self, user_id):
+        if user_id is None or self._sticky is None:
+            return False
+        return self._sticky.get(user_id, time.time()) is not None
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        super(SQLAlchemy, self).apply_driver_hacks(app, sa_url, options)
+        config = app.config
+        pool_size = config.get('DATABASE_POOL_SIZE')
+        if sa_url.drivername.startswith('sqlite'):
+            if sa_url.database in (None, '', ':memory:'):
+                return
+            options['sqlite_pragmas'] = sqlite_pragmas(config)
+            if not pool_size:
+                return
+            options['poolclass'] = QueuePool
+            # pooled connections move between threads, one at a time
+            options.setdefault('connect_args', {})['check_same_thread'] = False
+        else:
+            # a local file never goes stale, server connections do
+            if config.get('DATABASE_POOL_PRE_PING'):
+                options['pool_pre_ping'] = True
+            if config.get('DATABASE_POOL_RECYCLE'):
+                options['pool_recycle'] = config['DATABASE_POOL_RECYCLE']
+        if pool_size:
+            options['pool_size'] = pool_size
+            options['max_overflow'] = config.get('DATABASE_MAX_OVERFLOW', 10)
+            options['pool_timeout'] = config.get('DATABASE_POOL_TIMEOUT', 30)
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop('sqlite_pragmas', None)
+        engine = super(SQLAlchemy, self).create_engine(sa_url, engine_opts)
+        if pragmas:
+            @event.listens_for(engine, 'connect')
+            def set_sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+                cursor.close()
+        return engine
@@ -0,0 +1,45 @@
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+
+# dialects with a native "skip conflicting rows" INSERT
+IGNORE_DIALECTS = ('postgresql', 'sqlite', 'mysql')
+
+
+def insert_ignore(table, bind):
+    """INSERT that silently skips rows violating a unique or primary key
+    constraint. Run it with execute_insert_ignore, which returns the number
+    of rows actually added. Other dialects get a plain INSERT that
+    execute_insert_ignore guards with savepoints."""
+    dialect = bind.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return table.insert().prefix_with('OR IGNORE')
+    if dialect == 'mysql':
+        return table.insert().prefix_with('IGNORE')
+    return table.insert()
+
+
+def execute_insert_ignore(executor, statement, params=None):
+    """Executes an insert_ignore statement on a Session or Connection, with
+    ``params`` a dict or a list of dicts, and returns the rows added."""
+    bind = executor.get_bind() if hasattr(executor, 'get_bind') else executor
+    if bind.dialect.name in IGNORE_DIALECTS:
+        if params is None:
+            return executor.execute(statement).rowcount
+        return executor.execute(statement, params).rowcount
+    # one savepoint per row, so a conflict only discards its own row
+    added = 0
+    for row in params if isinstance(params, list) else [params]:
+        savepoint = executor.begin_nested()
+        try:
+            if row is None:
+                result = executor.execute(statement)
+            else:
+                result = executor.execute(statement, row)
+        except IntegrityError:
+            savepoint.rollback()
+            continue
+        savepoint.commit()
+        added += result.rowcount
+    return added
@@ -0,0 +1,84 @@
+from app import db, home_feed_cache
+from app.models import (MusicItem, MusicItemSimilarity, MUSIC_ITEM_COLUMNS, 
+                        user_pinned_music)
+
+# stable home feed order, also the keyset used for cursor pagination
+HOME_FEED_KEYSET = (MusicItem.listen_count, MusicItem.id)
+
+
+def _pinned_by(user_id, music_item_id):
+    # each probe is a lookup on the (user_id, music_item_id) primary key of
+    # the association table, aliased so it never correlates with an outer
+    # query that reads the same table
+    pinned = user_pinned_music.alias('pinned')
+    return db.exists().where(db.and_(
+                pinned.c.user_id == user_id,
+                pinned.c.music_item_id == music_item_id))
+
+
+def home_feed_query(user_id):
+    # anti-join through NOT EXISTS
+    pinned = _pinned_by(user_id, MusicItem.id)
+    return MusicItem.query.filter(~pinned).filter(
+                MusicItem.visible_to(user_id)).order_by(
+                    *[column.desc() for column in HOME_FEED_KEYSET])
+
+
+def materialized_home_feed_page(user_id, page, per_page):
+    """Rows (MUSIC_ITEM_COLUMNS) for a home feed page served from the user's
+    materialized feed, or None when the cache is off or the page lies
+    outside its window."""
+    if not home_feed_cache.enabled or page < 1 or per_page < 1:
+        return None
+    start = (page - 1) * per_page
+    if start + per_page > home_feed_cache.depth:
+        return None
+    ids = home_feed_cache.get(user_id)
+    if ids is None:
+        ids = [row.id for row in home_feed_query(user_id).with_entities(
+                    MusicItem.id).limit(home_feed_cache.depth)]
+        home_feed_cache.set(user_id, ids)
+    ids = ids[start:start + per_page]
+    if not ids:
+        return []
+    items = {row.id: row for row in MusicItem.query.filter(
+                MusicItem.id.in_(ids)).with_entities(*MUSIC_ITEM_COLUMNS)}
+    return [items[id] for id in ids if id in items]
+
+
+def recommended_music_ids(user_id, limit):
+    """Ids of up to ``limit`` unpinned items most similar to what the user
+    pinned, scored by the sum of their similarity to each pin."""
+    score = db.func.sum(MusicItemSimilarity.score)
+    similar_id = MusicItemSimilarity.similar_music_item_id
+    rows = db.session.query(similar_id).join(
+                user_pinned_music, 
+                user_pinned_music.c.music_item_id == MusicItemSimilarity.music_item_id).filter(
+                    user_pinned_music.c.user_id == user_id).filter(
+                        ~_pinned_by(user_id, similar_id)).group_by(similar_id).order_by(
+                            score.desc(), similar_id).limit(limit)
+    return [row[0] for row in rows]
+
+
+def recommended_home_feed_page(user_id, page, per_page, depth):
+    """Rows (MUSIC_ITEM_COLUMNS) for a page of the home feed ordered by
+    recommendation: the user's top ``depth`` recommended items first, then
+    the rest of the home feed in its usual order."""
+    if page < 1 or per_page < 1:
+        return []
+    start = (page - 1) * per_page
+    recommended = recommended_music_ids(user_id, depth)
+    rows = []
+    head = recommended[start:start + per_page]
+    if head:
+        items = {row.id: row for row in MusicItem.query.filter(
+                    MusicItem.id.in_(head)).filter(MusicItem.visible_to(user_id)
+                        ).with_entities(*MUSIC_ITEM_COLUMNS)}
+        rows = [items[id] for id in head if id in items]
+    if len(head) < per_page:
+        rest = home_feed_query(user_id)
+        if recommended:
+            rest = rest.filter(~MusicItem.id.in_(recommended))
+        rows.extend(rest.with_entities(*MUSIC_ITEM_COLUMNS).offset(
+                max(start - len(recommended), 0)).limit(per_page - len(head)))
+    return rows
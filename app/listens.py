@@ -0,0 +1,258 @@
+import atexit
+import threading
+from app.scheduler import PeriodicTask
+
+
+class ListenAggregator(object):
+    """Write-behind buffer for listen counts.
+
+    Plays are summed per music item in memory and written as one
+    ``listen_count = listen_count + n`` UPDATE per item, all in a single
+    transaction, once ``LISTEN_FLUSH_SIZE`` plays are buffered or every
+    ``LISTEN_FLUSH_INTERVAL`` seconds, and again when the process exits.
+    Flushes run on the background flusher, never in the recording request.
+    A failed flush keeps its plays buffered for the next one. While the
+    database is down the buffer holds at most ``LISTEN_BUFFER_MAX`` plays,
+    further ones are dropped and counted in ``dropped``. Plays buffered in a
+    process that is killed outright are lost.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.flush_size = 1000
+        self.flush_interval = 5
+        self.max_pending = 100000
+        self.flushed = 0
+        self.dropped = 0
+        self._counts = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task = None
+        atexit.register(self.flush)
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_size = app.config.get('LISTEN_FLUSH_SIZE', self.flush_size)
+        self.flush_interval = app.config.get('LISTEN_FLUSH_INTERVAL', 
+                                             self.flush_interval)
+        self.max_pending = app.config.get('LISTEN_BUFFER_MAX', self.max_pending)
+
+    def record(self, music_item_id, count=1):
+        self.record_many({music_item_id: count})
+
+    def record_many(self, counts):
+        with self._lock:
+            for music_item_id, count in counts.items():
+                count = min(count, self.max_pending - self._pending)
+                if count <= 0:
+                    self.dropped += counts[music_item_id]
+                    continue
+                self.dropped += counts[music_item_id] - count
+                self._counts[music_item_id] = self._counts.get(music_item_id, 0) + count
+                self._pending += count
+            flush_now = self._pending >= self.flush_size
+        self._ensure_started()
+        if flush_now:
+            if self._task is not None:
+                self._task.wake()
+            else:
+                # no flusher thread (LISTEN_FLUSH_INTERVAL = 0), the plays
+                # stay buffered if this fails and the request still succeeds
+                try:
+                    self.flush()
+                except Exception:
+                    self.app.logger.exception('Flushing listen counts failed')
+
+    def _ensure_started(self):
+        if self._task is None and self.flush_interval > 0:
+            with self._lock:
+                if self._task is None:
+                    self._task = PeriodicTask(self.app, 'listen-flush', 
+                                              self.flush, self.flush_interval)
+                    self._task.start()
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, {}
+                self._pending = 0
+            if not counts:
+                return 0
+            try:
+                with self.app.app_context():
+                    write_listen_counts(counts)
+            except Exception:
+                # put the plays back so the next flush retries them
+                self.record_counts_back(counts)
+                raise
+            self.flushed += sum(counts.values())
+            return len(counts)
+
+    def record_counts_back(self, counts):
+        with self._lock:
+            for music_item_id, count in counts.items():
+                self._counts[music_item_id] = self._counts.get(music_item_id, 0) + count
+                self._pending += count
+
+
+def write_listen_counts(counts):
+    from app import db, response_cache
+    from app.models import MusicItem
+    music_item = MusicItem.__table__
+    statement = music_item.update().where(
+            music_item.c.id == db.bindparam('item_id')).values(
+                listen_count=db.func.coalesce(music_item.c.listen_count, 0) + 
+                    db.bindparam('plays'))
+    # sorted ids give every flush the same lock order
+    with db.engine.begin() as connection:
+        connection.execute(statement, [
+                {'item_id': music_item_id, 'plays': plays}
+                for music_item_id, plays in sorted(counts.items())])
+    response_cache.note_change()
+
+
+def hour_of(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+# rows per multi-row INSERT, 4 parameters each stays under SQLite's
+# default limit of 999 bound parameters
+LISTEN_EVENT_INSERT_ROWS = 200
+
+
+def write_listen_events(events):
+    """Appends ``events``, dicts with user_id, music_item_id, started_at and
+    duration, in multi-row INSERTs of LISTEN_EVENT_INSERT_ROWS events."""
+    from app import db
+    from app.models import ListenEvent
+    for start in range(0, len(events), LISTEN_EVENT_INSERT_ROWS):
+        db.session.execute(ListenEvent.__table__.insert().values(
+                events[start:start + LISTEN_EVENT_INSERT_ROWS]))
+
+
+def _merge_hourly(table, key, totals):
+    # adds {(key id, hour): [listens, seconds]} to the rollup rows, updating
+    # the ones that exist and inserting the rest
+    from app import db
+    key_column = table.c[key]
+    existing = {tuple(row) for row in db.session.execute(
+            db.select([key_column, table.c.hour]).where(db.and_(
+                key_column.in_({id for id, _ in totals}), 
+                table.c.hour.in_({hour for _, hour in totals}))))}
+    inserts, updates = [], []
+    for (id, hour), (listens, seconds) in sorted(totals.items()):
+        if (id, hour) in existing:
+            updates.append({'key_id': id, 'key_hour': hour, 
+                            'added_listens': listens, 'added_seconds': seconds})
+        else:
+            inserts.append({key: id, 'hour': hour, 
+                            'listens': listens, 'seconds': seconds})
+    if updates:
+        db.session.execute(table.update().where(db.and_(
+                key_column == db.bindparam('key_id'), 
+                table.c.hour == db.bindparam('key_hour'))).values(
+                    listens=table.c.listens + db.bindparam('added_listens'), 
+                    seconds=table.c.seconds + db.bindparam('added_seconds')), 
+                updates)
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+
+def rollup_listen_events(batch_size=5000):
+    """Folds raw listen events into the hourly per item and per user rollups
+    and deletes them, oldest first, in committed batches of ``batch_size``.
+
+    Each batch is deleted before its totals are written, in the same
+    transaction. A second run working at the same time deletes fewer rows
+    than it read, or hits the rollup primary keys, and backs off with its
+    transaction rolled back, so no event is counted twice. Returns the number
+    of events rolled up.
+    """
+    from sqlalchemy.exc import IntegrityError
+    from app import db
+    from app.models import ListenEvent, ListenHourlyMusicItem, ListenHourlyUser
+    events = ListenEvent.__table__
+    rolled_up = 0
+    while True:
+        rows = db.session.execute(db.select([
+                    events.c.id, events.c.user_id, events.c.music_item_id, 
+                    events.c.started_at, events.c.duration]).order_by(
+                        events.c.id).limit(batch_size)).fetchall()
+        if not rows:
+            break
+        deleted = db.session.execute(events.delete().where(
+                events.c.id.between(rows[0].id, rows[-1].id))).rowcount
+        if deleted != len(rows):
+            db.session.rollback()
+            break
+        by_item, by_user = {}, {}
+        for id, user_id, music_item_id, started_at, duration in rows:
+            hour = hour_of(started_at)
+            for totals, key in ((by_item, (music_item_id, hour)), 
+                                (by_user, (user_id, hour))):
+                total = totals.setdefault(key, [0, 0])
+                total[0] += 1
+                total[1] += duration
+        try:
+            _merge_hourly(ListenHourlyMusicItem.__table__, 'music_item_id', by_item)
+            _merge_hourly(ListenHourlyUser.__table__, 'user_id', by_user)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            break
+        rolled_up += len(rows)
+        if len(rows) < batch_size:
+            break
+    return rolled_up
+
+
+def listening_stats(rollup, key_column, key, since, until, bucket='hour'):
+    """Totals and per ``bucket`` ('hour' or 'day') series of listens and
+    seconds listened from an hourly rollup, for the rows of ``key`` in
+    [since, until). Empty buckets are left out."""
+    from app import db
+    rows = db.session.query(rollup.hour, rollup.listens, rollup.seconds).filter(
+            key_column == key, rollup.hour >= hour_of(since), 
+            rollup.hour < until).order_by(rollup.hour)
+    series = []
+    total_listens = total_seconds = 0
+    for hour, listens, seconds in rows:
+        start = hour if bucket == 'hour' else hour.replace(hour=0)
+        if not series or series[-1]['start'] != start:
+            series.append({'start': start, 'listens': 0, 'seconds': 0})
+        series[-1]['listens'] += listens
+        series[-1]['seconds'] += seconds
+        total_listens += listens
+        total_seconds += seconds
+    for point in series:
+        point['start'] = point['start'].isoformat() + 'Z'
+    return {
+        'since': since.isoformat() + 'Z',
+        'until': until.isoformat() + 'Z',
+        'bucket': bucket,
+        'listens': total_listens,
+        'seconds': total_seconds,
+        'series': series
+    }
+
+
+def top_music_query(since, until):
+    """(music_item_id, listens, seconds) of public items over [since, until),
+    most listened first."""
+    from app import db
+    from app.models import ListenHourlyMusicItem, MusicItem
+    listens = db.func.sum(ListenHourlyMusicItem.listens)
+    return db.session.query(
+                ListenHourlyMusicItem.music_item_id, listens.label('listens'), 
+                db.func.sum(ListenHourlyMusicItem.seconds).label('seconds')).join(
+                    MusicItem, MusicItem.id == ListenHourlyMusicItem.music_item_id).filter(
+                        ListenHourlyMusicItem.hour >= hour_of(since), 
+                        ListenHourlyMusicItem.hour < until, 
+                        MusicItem.private.isnot(True)).group_by(
+                            ListenHourlyMusicItem.music_item_id).order_by(
+                                listens.desc(), ListenHourlyMusicItem.music_item_id)
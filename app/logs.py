@@ -0,0 +1,121 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import request
+from app.metrics import request_stats
+
+ACCESS_LOGGER = 'app.access'
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler over a bounded queue that drops records instead of
+    blocking the logging thread when the queue is full."""
+
+    def __init__(self, maxsize):
+        super(DroppingQueueHandler, self).__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class AccessLogFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))}
+        entry.update(getattr(record, 'access', {}))
+        return json.dumps(entry, sort_keys=True)
+
+
+class QueuedLogging(object):
+    """Application and access logs written to rotating files by a
+    background ``QueueListener``.
+
+    Request threads only format and enqueue records. When the queue holds
+    ``LOG_QUEUE_SIZE`` records further ones are dropped and counted in
+    ``dropped`` rather than slowing requests down.
+    """
+
+    def __init__(self):
+        self.handler = None
+        self.listener = None
+        self.app_logger = None
+        self.access_logger = logging.getLogger(ACCESS_LOGGER)
+        self.access_logger.propagate = False
+        atexit.register(self.stop)
+
+    def init_app(self, app):
+        self.stop()
+        directory = app.config.get('LOG_DIR', 'logs')
+        if not os.path.exists(directory):
+            os.mkdir(directory)
+        max_bytes = app.config.get('LOG_MAX_BYTES', 10 * 1024 * 1024)
+        backup_count = app.config.get('LOG_BACKUP_COUNT', 10)
+
+        file_handler = RotatingFileHandler(os.path.join(directory, 'api.log'),
+                maxBytes=max_bytes, backupCount=backup_count)
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
+        file_handler.setLevel(logging.INFO)
+        file_handler.addFilter(lambda record: record.name != ACCESS_LOGGER)
+        handlers = [file_handler]
+
+        if app.config.get('ACCESS_LOG', True):
+            access_handler = RotatingFileHandler(os.path.join(directory, 'access.log'),
+                    maxBytes=max_bytes, backupCount=backup_count)
+            access_handler.setFormatter(AccessLogFormatter())
+            access_handler.addFilter(logging.Filter(ACCESS_LOGGER))
+            handlers.append(access_handler)
+            app.after_request(self._log_request)
+
+        self.handler = DroppingQueueHandler(app.config.get('LOG_QUEUE_SIZE', 10000))
+        self.listener = QueueListener(self.handler.queue, *handlers,
+                                      respect_handler_level=True)
+        self.listener.start()
+        self.app_logger = app.logger
+        self.app_logger.addHandler(self.handler)
+        self.app_logger.setLevel(logging.INFO)
+        self.access_logger.handlers = [self.handler]
+        self.access_logger.setLevel(logging.INFO)
+
+    @property
+    def dropped(self):
+        return self.handler.dropped if self.handler is not None else 0
+
+    def _log_request(self, response):
+        queries, db_time, elapsed = request_stats()
+        self.access_logger.info('', extra={'access': {
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'latency_ms': round(elapsed * 1000, 2),
+            'queries': queries,
+            'db_ms': round(db_time * 1000, 2)
+        }})
+        return response
+
+    def stop(self):
+        if self.listener is not None:
+            # drains whatever is still queued before returning
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+        if self.handler is not None:
+            # the loggers are shared by every app created in this process, a
+            # later init_app must not find this handler and its dead queue
+            if self.app_logger is not None:
+                self.app_logger.removeHandler(self.handler)
+            self.access_logger.removeHandler(self.handler)
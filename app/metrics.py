@@ -0,0 +1,152 @@
+import threading
+import time
+from bisect import bisect_left
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# per thread request state, cheaper than flask.g inside cursor events
+_local = threading.local()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if getattr(_local, 'active', False):
+        _local.query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if getattr(_local, 'active', False):
+        _local.queries += 1
+        _local.db_time += time.perf_counter() - _local.query_start
+
+
+def request_stats():
+    """(queries, db seconds, elapsed seconds) for the current request."""
+    if not getattr(_local, 'active', False):
+        return 0, 0.0, 0.0
+    return (_local.queries, _local.db_time,
+            time.perf_counter() - _local.request_start)
+
+
+def last_request_stats():
+    """request_stats of the last request recorded on this thread, for
+    streamed responses that cannot carry a Server-Timing header."""
+    return getattr(_local, 'last', (0, 0.0, 0.0))
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(object):
+    """Counts SQL statements and database time per request through engine
+    events, adds an optional ``Server-Timing`` header and aggregates
+    per-endpoint latency histograms rendered in Prometheus text format.
+    """
+
+    def __init__(self):
+        self.server_timing = False
+        self._latency = {}
+        self._requests = {}
+        self._queries = {}
+        self._lock = threading.Lock()
+        self._listening = False
+
+    def init_app(self, app):
+        self.server_timing = app.config.get('METRICS_SERVER_TIMING', False)
+        if not self._listening:
+            # class level listeners cover every engine, replicas included
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            self._listening = True
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        _local.active = True
+        _local.queries = 0
+        _local.db_time = 0.0
+        _local.request_start = time.perf_counter()
+        _local.streamed_status = None
+
+    def _after_request(self, response):
+        if response.is_streamed:
+            # the body is produced after this hook. stream_with_context keeps
+            # the request context until it is exhausted, so the teardown
+            # below records the request with the streaming included
+            _local.streamed_status = response.status_code
+            return response
+        queries, db_time, elapsed = request_stats()
+        self._record(response.status_code, queries, db_time, elapsed)
+        if self.server_timing:
+            response.headers.add('Server-Timing',
+                'db;dur={:.2f};desc="{} queries", app;dur={:.2f}'.format(
+                    db_time * 1000, queries, elapsed * 1000))
+        return response
+
+    def _teardown_request(self, exc):
+        status = getattr(_local, 'streamed_status', None)
+        if status is not None:
+            _local.streamed_status = None
+            self._record(status, *request_stats())
+        _local.active = False
+
+    def _record(self, status, queries, db_time, elapsed):
+        _local.last = (queries, db_time, elapsed)
+        key = (request.endpoint or 'unknown', request.method)
+        with self._lock:
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(elapsed)
+            status_key = key + (status,)
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+            totals = self._queries.setdefault(key, [0, 0.0])
+            totals[0] += queries
+            totals[1] += db_time
+
+    def render(self, extra=None):
+        lines = []
+        with self._lock:
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append('http_requests_total{{endpoint="{}",method="{}",status="{}"}} {}'.format(
+                    endpoint, method, status, count))
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for (endpoint, method), histogram in sorted(self._latency.items()):
+                labels = 'endpoint="{}",method="{}"'.format(endpoint, method)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append('http_request_duration_seconds_bucket{{{},le="{}"}} {}'.format(
+                        labels, bound, cumulative))
+                lines.append('http_request_duration_seconds_sum{{{}}} {:.6f}'.format(
+                    labels, histogram.sum))
+                lines.append('http_request_duration_seconds_count{{{}}} {}'.format(
+                    labels, histogram.count))
+            lines.append('# TYPE sql_queries_total counter')
+            for (endpoint, method), (queries, _) in sorted(self._queries.items()):
+                lines.append('sql_queries_total{{endpoint="{}",method="{}"}} {}'.format(
+                    endpoint, method, queries))
+            lines.append('# TYPE sql_duration_seconds_total counter')
+            for (endpoint, method), (_, db_time) in sorted(self._queries.items()):
+                lines.append('sql_duration_seconds_total{{endpoint="{}",method="{}"}} {:.6f}'.format(
+                    endpoint, method, db_time))
+        for name, value in sorted((extra or {}).items()):
+            lines.append('{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
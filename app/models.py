@@ -1,9 +1,15 @@
 import enum
 import base64
+import json
 import os
+import time
 from datetime import datetime, timedelta
-from app import db
-from flask import url_for
+from app import db, token_cache, home_feed_cache
+from flask_sqlalchemy import Pagination
+from app import token_signing
+from app.dialects import insert_ignore, execute_insert_ignore
+from app.ranks import rank_between, evenly_spaced_ranks
+from flask import abort, current_app, url_for
 from werkzeug.security import generate_password_hash, check_password_hash
 
 user_pinned_music = db.Table('user_pinned_music', 
@@ -22,16 +28,43 @@ class MusicTypeEnum(enum.Enum):
 
 class PaginatedAPIMixin(object):
     @staticmethod 
-    def to_collection_dict(query, page, per_page, endpoint, **kwargs):
-        resources = query.paginate(page, per_page, False)
+    def to_collection_dict(query, page, per_page, endpoint, cursor=None, 
+                           keyset=None, total=None, include_totals=True, 
+                           items=None, columns=None, row_to_dict=None, 
+                           ascending=False, **kwargs):
+        # with columns and row_to_dict, only those columns are selected and
+        # rows are serialized directly, no ORM instances are built
+        if columns is not None:
+            if cursor is not None and keyset is not None:
+                # the next cursor is read from the last row, so keyset columns
+                # from other tables are selected after the requested ones
+                columns = tuple(columns) + tuple(column for column in keyset
+                            if not any(column is other for other in columns))
+            query = query.with_entities(*columns)
+        else:
+            row_to_dict = to_dict
+        if cursor is not None and keyset is not None:
+            return PaginatedAPIMixin.to_cursor_collection_dict(
+                    query, cursor, per_page, endpoint, keyset, 
+                    row_to_dict=row_to_dict, ascending=ascending, **kwargs)
+        if items is not None:
+            # page already materialized by the caller
+            resources = Pagination(query, page, per_page, total, items)
+        elif include_totals and total is None:
+            resources = query.paginate(page, per_page, False)
+        else:
+            # total is already known (or not wanted), skip the COUNT query
+            resources = paginate_without_count(query, page, per_page, total)
+        meta = {
+            'page': page, 
+            'per_page': per_page
+        }
+        if include_totals:
+            meta['total_pages'] = resources.pages
+            meta['total_items'] = resources.total
         data = {
-            'items': [item.to_dict() for item in resources.items],
-            '_meta': {
-                'page': page, 
-                'per_page': per_page,
-                'total_pages': resources.pages,
-                'total_items': resources.total
-            },
+            'items': [row_to_dict(item) for item in resources.items],
+            '_meta': meta,
             '_links': {
                 'self': url_for(endpoint, page=page, per_page=per_page, **kwargs),
                 'next': url_for(endpoint, page=page + 1, per_page=per_page, **kwargs),
@@ -40,10 +73,92 @@ class PaginatedAPIMixin(object):
         }
         return data
 
+    @staticmethod 
+    def to_cursor_collection_dict(query, cursor, per_page, endpoint, keyset, 
+                                  row_to_dict=None, ascending=False, **kwargs):
+        # keyset pagination: rows are ordered by the keyset columns descending
+        # (or ascending; the last column must be unique, normally the id) and
+        # each page starts strictly after the position encoded in the cursor,
+        # so there is no OFFSET scan and no COUNT
+        query = query.order_by(None).order_by(
+                    *[column.asc() if ascending else column.desc() 
+                      for column in keyset])
+        if cursor:
+            values = decode_cursor(cursor, len(keyset))
+            if values is None:
+                abort(400, 'Invalid cursor')
+            query = query.filter(keyset_after(keyset, values, ascending))
+        items = query.limit(per_page + 1).all()
+        next_cursor = None
+        if len(items) > per_page:
+            items = items[:per_page]
+            if items:
+                next_cursor = encode_cursor(
+                        [getattr(items[-1], column.key) for column in keyset])
+        data = {
+            'items': [(row_to_dict or to_dict)(item) for item in items],
+            '_meta': {
+                'per_page': per_page,
+                'cursor': cursor,
+                'next_cursor': next_cursor
+            },
+            '_links': {
+                'self': url_for(endpoint, cursor=cursor, per_page=per_page, **kwargs),
+                'next': url_for(endpoint, cursor=next_cursor, per_page=per_page, 
+                                **kwargs) if next_cursor else None
+            }
+        }
+        return data
+
+def to_dict(item):
+    return item.to_dict()
+
+def paginate_without_count(query, page, per_page, total=None):
+    # same clamping as query.paginate(page, per_page, error_out=False)
+    page = max(page, 1)
+    if per_page < 0:
+        per_page = 20
+    items = query.limit(per_page).offset((page - 1) * per_page).all()
+    return Pagination(query, page, per_page, total, items)
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(
+            json.dumps(values, separators=(',', ':')).encode('utf8')
+        ).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(
+                    cursor + '=' * (-len(cursor) % 4)).decode('utf8'))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    # only scalars can be compared with keyset columns
+    if not all(isinstance(value, (str, int, float)) and not isinstance(value, bool) 
+               for value in values):
+        return None
+    return values
+
+def keyset_after(keyset, values, ascending=False):
+    # (a, b, c) < (x, y, z) expanded for databases without row value support
+    clauses = []
+    for i, column in enumerate(keyset):
+        equal = [keyset[j] == values[j] for j in range(i)]
+        after = column > values[i] if ascending else column < values[i]
+        clauses.append(db.and_(*(equal + [after])))
+    return db.or_(*clauses)
+
 class User(PaginatedAPIMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, index=True)
     password_hash = db.Column(db.String(128))
+    token_epoch = db.Column(db.Integer, default=0, server_default='0')
+    # denormalized list sizes, kept in step by the pin/private methods below
+    pinned_count = db.Column(db.Integer, default=0, server_default='0')
+    private_count = db.Column(db.Integer, default=0, server_default='0')
+    # bumped on every pinned or private list change, used for list ETags
+    list_version = db.Column(db.Integer, default=0, server_default='0')
 
     pinned_music = db.relationship(
         'MusicItem', 
@@ -56,7 +171,7 @@ class User(PaginatedAPIMixin, db.Model):
         lazy='dynamic', 
         backref=db.backref('pinned_users', lazy='dynamic'))
     tokens = db.relationship('UserToken', backref='user', lazy='dynamic')
-    #relationship: playlist
+    playlists = db.relationship('Playlist', backref='user', lazy='dynamic')
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -67,41 +182,46 @@ class User(PaginatedAPIMixin, db.Model):
     def get_user_tokens(self, access_token_expires_in=900, 
                         refresh_token_expires_in=7200, full_refresh=False):
         now = datetime.utcnow()
-
-        access_token = self.tokens.filter(
-                UserToken.expiration > now, 
-                UserToken.token_type == 'access').order_by(
-                    UserToken.expiration.desc()).first()
-        
-        refresh_token = self.tokens.filter(
-                UserToken.expiration > now, 
-                UserToken.token_type == 'refresh').order_by(
-                    UserToken.expiration.desc()).first()
+        signed = current_app.config.get('ACCESS_TOKEN_FORMAT') == 'signed'
+
+        # both token types come back from one query on the 
+        # (user_id, token_type, expiration) index, newest first. signed
+        # access tokens are never stored so there is nothing to look up
+        token_types = ['refresh'] if signed else ['access', 'refresh']
+        live_tokens = self.tokens.filter(
+                UserToken.token_type.in_(token_types),
+                UserToken.expiration > now).order_by(
+                    UserToken.expiration.desc()).all()
+        access_token = next((user_token for user_token in live_tokens 
+                                if user_token.token_type == 'access'), None)
+        refresh_token = next((user_token for user_token in live_tokens 
+                                if user_token.token_type == 'refresh'), None)
 
         if (full_refresh == False and refresh_token and 
                 refresh_token.expiration > now + timedelta(seconds=120) and 
                 access_token):
             return {
-                'access_token': access_token
+                'access_token': access_token,
+                'refresh_token': refresh_token
             } 
         if (full_refresh == False and refresh_token and 
                 refresh_token.expiration > now + timedelta(seconds=120) and 
                 access_token is None):
-            new_access_token = UserToken()
-            new_access_token.user_id = self.id 
-            new_access_token.token_type = 'access'
-            new_access_token.token = base64.b64encode(os.urandom(24)).decode('utf8')
-            new_access_token.expiration = now + timedelta(
-                                            seconds=access_token_expires_in)
-            db.session.add(new_access_token)
             return {
-                'access_token': new_access_token,
+                'access_token': self.new_access_token(
+                                    now, access_token_expires_in),
                 'refresh_token': refresh_token
             } 
-        if refresh_token:
-            refresh_token.revoke_token()
-        if access_token: 
-            access_token.revoke_token()
+        if live_tokens:
+            UserToken.revoke_tokens(live_tokens, now)
+            if signed:
+                # signed access tokens have no row to expire, bumping the
+                # epoch revokes them as revoke_user_tokens does. flushed so
+                # the new access token below carries the new epoch
+                self.token_epoch = db.func.coalesce(User.token_epoch, 0) + 1
+                db.session.add(self)
+                db.session.flush()
+                token_cache.invalidate_user(self.id)
 
         new_refresh_token = UserToken()
         new_refresh_token.user_id = self.id 
@@ -110,25 +230,116 @@ class User(PaginatedAPIMixin, db.Model):
         new_refresh_token.expiration = now + timedelta(
                                         seconds=refresh_token_expires_in)
         db.session.add(new_refresh_token)
-        
-        new_access_token = UserToken()
-        new_access_token.user_id = self.id 
-        new_access_token.token_type = 'access'
-        new_access_token.token = base64.b64encode(os.urandom(24)).decode('utf8')
-        new_access_token.expiration = now + timedelta(
-                                        seconds=access_token_expires_in)
-        db.session.add(new_access_token)
 
         return {
-                'access_token': new_access_token,
+                'access_token': self.new_access_token(
+                                    now, access_token_expires_in),
                 'refresh_token': new_refresh_token
             } 
 
-    def pin_music_item(self, music_item):
-        self.pinned_music.append(music_item) 
+    def new_access_token(self, now, expires_in):
+        new_access_token = UserToken()
+        new_access_token.user_id = self.id 
+        new_access_token.token_type = 'access'
+        new_access_token.expiration = now + timedelta(seconds=expires_in)
+        if current_app.config.get('ACCESS_TOKEN_FORMAT') == 'signed':
+            # self contained token, returned to the client but never persisted
+            new_access_token.token = token_signing.encode_token({
+                    'uid': self.id,
+                    'typ': 'access',
+                    'exp': int(time.time()) + expires_in,
+                    'ep': self.token_epoch or 0
+                }, current_app.config['SECRET_KEY'])
+            return new_access_token
+        new_access_token.token = base64.b64encode(os.urandom(24)).decode('utf8')
+        db.session.add(new_access_token)
+        return new_access_token
 
-    def unpin_music_item(self, music_item):
-        self.pinned_music.remove(music_item)
+    def revoke_user_tokens(self):
+        now = datetime.utcnow()
+        UserToken.query.filter(
+                UserToken.user_id == self.id, 
+                UserToken.token_type.in_(['access', 'refresh']),
+                UserToken.expiration > now).update(
+                    {UserToken.expiration: now - timedelta(seconds=1)}, 
+                    synchronize_session=False)
+        # bumping the epoch invalidates every signed access token issued so far
+        self.token_epoch = db.func.coalesce(User.token_epoch, 0) + 1
+        db.session.add(self)
+        token_cache.invalidate_user(self.id)
+
+    def pin_music_item(self, music_item_id):
+        # a single idempotent INSERT .. SELECT, nothing is inserted when the
+        # item does not exist, is someone else's private item or is already
+        # pinned. pin_count only moves when a row was actually added, so
+        # concurrent pins cannot double count
+        music_item = MusicItem.__table__
+        added = execute_insert_ignore(db.session, 
+                insert_ignore(user_pinned_music, db.session.get_bind()).from_select(
+                    ['user_id', 'music_item_id'],
+                    db.select([db.literal(self.id, db.Integer), music_item.c.id]).where(
+                        db.and_(music_item.c.id == music_item_id, 
+                                MusicItem.visible_to(self.id)))))
+        if added != 1:
+            return False
+        MusicItem.adjust_pin_count(music_item_id, 1)
+        self.adjust_list_count('pinned_count', 1)
+        return True
+
+    def unpin_music_item(self, music_item_id):
+        result = db.session.execute(user_pinned_music.delete().where(db.and_(
+                    user_pinned_music.c.user_id == self.id,
+                    user_pinned_music.c.music_item_id == music_item_id)))
+        if result.rowcount != 1:
+            return False
+        MusicItem.adjust_pin_count(music_item_id, -1)
+        self.adjust_list_count('pinned_count', -1)
+        return True
+
+    def pin_music_items(self, music_item_ids):
+        # set based version of pin_music_item, returns a status per id
+        statuses = self._pin_statuses(music_item_ids)
+        to_pin = [id for id, pinned in statuses.items() if pinned is False]
+        if to_pin:
+            music_item = MusicItem.__table__
+            added = execute_insert_ignore(db.session, 
+                    insert_ignore(user_pinned_music, db.session.get_bind()).from_select(
+                        ['user_id', 'music_item_id'],
+                        db.select([db.literal(self.id, db.Integer), music_item.c.id]).where(
+                            music_item.c.id.in_(to_pin))))
+            MusicItem.adjust_pin_counts(to_pin, added, 1)
+            self.adjust_list_count('pinned_count', added)
+        return {id: 'not_found' if pinned is None else 
+                    'already_pinned' if pinned else 'pinned'
+                for id, pinned in statuses.items()}
+
+    def unpin_music_items(self, music_item_ids):
+        statuses = self._pin_statuses(music_item_ids)
+        to_unpin = [id for id, pinned in statuses.items() if pinned]
+        if to_unpin:
+            removed = db.session.execute(user_pinned_music.delete().where(db.and_(
+                        user_pinned_music.c.user_id == self.id,
+                        user_pinned_music.c.music_item_id.in_(to_unpin)))).rowcount
+            MusicItem.adjust_pin_counts(to_unpin, removed, -1)
+            self.adjust_list_count('pinned_count', -removed)
+        return {id: 'not_found' if pinned is None else 
+                    'unpinned' if pinned else 'not_pinned'
+                for id, pinned in statuses.items()}
+
+    def _pin_statuses(self, music_item_ids):
+        # one outer join answers both "can the user see it" and "is it
+        # pinned", None means the item does not exist or is someone else's
+        # private item
+        statuses = dict.fromkeys(music_item_ids)
+        rows = db.session.query(MusicItem.id, user_pinned_music.c.user_id).outerjoin(
+                user_pinned_music, db.and_(
+                    user_pinned_music.c.music_item_id == MusicItem.id,
+                    user_pinned_music.c.user_id == self.id)).filter(
+                        MusicItem.id.in_(music_item_ids), 
+                        MusicItem.visible_to(self.id))
+        for music_item_id, user_id in rows:
+            statuses[music_item_id] = user_id is not None
+        return statuses
 
     def is_pinned(self, music_item):
         return self.pinned_music.filter(
@@ -136,9 +347,29 @@ class User(PaginatedAPIMixin, db.Model):
 
     def create_private_music_item(self, music_item):
         self.private_music.append(music_item)
+        self.adjust_list_count('private_count', 1)
 
     def remove_private_music_item(self, music_item):
         self.private_music.remove(music_item)
+        self.adjust_list_count('private_count', -1)
+
+    def adjust_list_count(self, field, delta):
+        if not delta:
+            return
+        column = getattr(User, field)
+        setattr(self, field, db.func.coalesce(column, 0) + delta)
+        self.list_version = db.func.coalesce(User.list_version, 0) + 1
+        db.session.add(self)
+        # cached snapshots of this user now carry a stale count, and the
+        # home feed excludes pinned items
+        token_cache.invalidate_user(self.id)
+        home_feed_cache.invalidate(self.id)
+
+    @staticmethod
+    def current_list_version(user_id):
+        # read by primary key rather than trusting a cached user snapshot
+        return db.session.query(User.list_version).filter(
+                User.id == user_id).scalar() or 0
 
     def is_in_private_list(self, music_item):
         return self.pinned_music.filter(
@@ -161,38 +392,147 @@ class User(PaginatedAPIMixin, db.Model):
         return '<User id={} email={}>'.format(self.id, self.email)
 
 class UserToken(db.Model):
+    __table_args__ = (db.Index('ix_user_token_user_id_token_type_expiration', 
+                               'user_id', 'token_type', 'expiration'),)
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     token_type = db.Column(db.String(24))
     token = db.Column(db.String(48), unique=True, index=True)
-    expiration = db.Column(db.DateTime())
+    expiration = db.Column(db.DateTime(), index=True)
 
     @staticmethod 
     def check_token(token, token_type='access'):
-        user_token = UserToken.query.filter_by(token=token, token_type=token_type).first()
+        cached_user = token_cache.get(token, token_type)
+        if cached_user is not None:
+            return db.session.merge(cached_user, load=False)
+        user_token = UserToken.query.options(db.joinedload(UserToken.user)).filter_by(
+                token=token, token_type=token_type).first()
         if (user_token and user_token.expiration > datetime.utcnow() and 
                 user_token.user):
+            token_cache.set(token, token_type, 
+                    UserToken.user_snapshot(user_token.user), user_token.expiration)
             return user_token.user
         return None
 
+    @staticmethod 
+    def check_signed_token(token, token_type='access'):
+        payload = token_signing.decode_token(token, current_app.config['SECRET_KEY'])
+        if (payload is None or payload.get('typ') != token_type or 
+                payload.get('exp', 0) <= time.time()):
+            return None
+        cached_user = token_cache.get(token, token_type)
+        if cached_user is not None:
+            return db.session.merge(cached_user, load=False)
+        user = User.query.get(payload.get('uid'))
+        if user is None or (user.token_epoch or 0) != payload.get('ep'):
+            return None
+        token_cache.set(token, token_type, UserToken.user_snapshot(user), 
+                        datetime.utcfromtimestamp(payload['exp']))
+        return user
+
+    @staticmethod 
+    def user_snapshot(user):
+        # detached copy of the loaded columns so a cached user can be merged
+        # into later sessions without emitting a SELECT
+        snapshot = User(**{column.key: getattr(user, column.key) 
+                            for column in User.__table__.columns})
+        db.make_transient_to_detached(snapshot)
+        return snapshot
+
+    @staticmethod 
+    def purge_expired(batch_size=1000, max_batches=None, before=None):
+        # deletes in small committed batches so no single statement holds
+        # locks on user_token for long, returns the number of rows removed
+        before = before or datetime.utcnow()
+        purged = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            ids = [row.id for row in db.session.query(UserToken.id).filter(
+                    UserToken.expiration < before).order_by(
+                        UserToken.expiration).limit(batch_size)]
+            if not ids:
+                break
+            UserToken.query.filter(UserToken.id.in_(ids)).delete(
+                    synchronize_session=False)
+            db.session.commit()
+            purged += len(ids)
+            batches += 1
+        return purged
+
     def revoke_token(self):
         self.expiration = datetime.utcnow() - timedelta(seconds=1)
+        token_cache.invalidate(self.token, self.token_type)
         db.session.add(self)
 
+    @staticmethod 
+    def revoke_tokens(user_tokens, now=None):
+        # one UPDATE for the whole set instead of a flush per token
+        now = now or datetime.utcnow()
+        UserToken.query.filter(
+                UserToken.id.in_([user_token.id for user_token in user_tokens])
+            ).update({UserToken.expiration: now - timedelta(seconds=1)}, 
+                     synchronize_session=False)
+        for user_token in user_tokens:
+            token_cache.invalidate(user_token.token, user_token.token_type)
+
     def __repr__(self):
         return '<UserToken id={} user_id={}, token_type={}, token={}, expiration={}>'.format(
                 self.id, self.user_id, self.token_type, self.token, self.expiration
             )
 
 class MusicItem(PaginatedAPIMixin, db.Model):
-    __table_args__ = (db.UniqueConstraint('resource_type', 'resource_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('resource_type', 'resource_id'),
+        db.Index('ix_music_item_pin_count_id', 'pin_count', 'id'),
+        db.Index('ix_music_item_listen_count_id', 'listen_count', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     resource_type = db.Column(db.Enum(MusicTypeEnum))
     resource_id = db.Column(db.String(48))
-    pin_count = db.Column(db.Integer, index=True)
-    listen_count = db.Column(db.Integer, index=True)
+    pin_count = db.Column(db.Integer, default=0, server_default='0')
+    listen_count = db.Column(db.Integer, default=0, server_default='0')
     private = db.Column(db.Boolean)
 
+    @staticmethod 
+    def adjust_pin_count(music_item_id, delta):
+        music_item = MusicItem.__table__
+        db.session.execute(music_item.update().where(
+                music_item.c.id == music_item_id).values(
+                    pin_count=db.func.coalesce(music_item.c.pin_count, 0) + delta))
+
+    @staticmethod 
+    def adjust_pin_counts(music_item_ids, affected, delta):
+        # one pin_count + delta UPDATE when the batch statement touched a row
+        # for every id. Fewer rows means a concurrent request of the same
+        # user got to some of them first, which ones is unknown, so only
+        # then are those items recounted
+        if affected == len(music_item_ids):
+            music_item = MusicItem.__table__
+            db.session.execute(music_item.update().where(
+                    music_item.c.id.in_(music_item_ids)).values(
+                        pin_count=db.func.coalesce(music_item.c.pin_count, 0) + delta))
+        else:
+            MusicItem.recount_pins(music_item_ids)
+
+    @staticmethod 
+    def recount_pins(music_item_ids):
+        # recomputed from the association table rather than adjusted, so the
+        # result is exact whatever concurrent batches did to the same items
+        music_item = MusicItem.__table__
+        db.session.execute(music_item.update().where(
+                music_item.c.id.in_(music_item_ids)).values(
+                    pin_count=db.select([db.func.count()]).where(
+                        user_pinned_music.c.music_item_id == music_item.c.id
+                    ).as_scalar()))
+
+    @staticmethod 
+    def visible_to(user_id):
+        # public items plus the user's own private items
+        own_private = db.exists().where(db.and_(
+                    user_private_music.c.user_id == user_id,
+                    user_private_music.c.music_item_id == MusicItem.id))
+        return db.or_(MusicItem.private.isnot(True), own_private)
+
     def from_dict(self, data, private=False):
         for field in ['resource_type', 'resource_id']:
             setattr(self, field, data[field])
@@ -214,6 +554,242 @@ class MusicItem(PaginatedAPIMixin, db.Model):
                 self.id, self.resource_type, self.resource_id
             )
 
+class MusicItemTrend(db.Model):
+    """Materialized trending score of a public music item.
+
+    ``score`` is the natural log of the item's listens and pins, each
+    weighted by ``exp((t - TRENDING_EPOCH) / tau)``. Scaling every score by the
+    same decay factor does not change their order, so new activity only has
+    to be added to the rows it touches and older rows never need rewriting.
+    ``listen_count`` and ``pin_count`` are the item counts already scored.
+    """
+    __table_args__ = (
+        db.Index('ix_music_item_trend_score_music_item_id', 'score', 'music_item_id'),
+    )
+    music_item_id = db.Column(db.Integer, db.ForeignKey('music_item.id'), primary_key=True)
+    # double precision, the score is compared exactly in keyset cursors
+    score = db.Column(db.Float(precision=53), nullable=False)
+    listen_count = db.Column(db.Integer, default=0, server_default='0')
+    pin_count = db.Column(db.Integer, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class MusicItemSimilarity(db.Model):
+    """Top-K most similar public items of a music item by cosine similarity
+    of their pins, ``rank`` 0 being the closest. Rebuilt by build_similarity.
+    """
+    music_item_id = db.Column(db.Integer, db.ForeignKey('music_item.id'), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    similar_music_item_id = db.Column(db.Integer, db.ForeignKey('music_item.id'), 
+                                      nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+class Playlist(PaginatedAPIMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    name = db.Column(db.String(120), nullable=False)
+    item_count = db.Column(db.Integer, default=0, server_default='0')
+    # set once a rank passes PLAYLIST_RANK_MAX_LENGTH, see rebalance_flagged
+    needs_rebalance = db.Column(db.Boolean, default=False, server_default=db.false())
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    items = db.relationship('PlaylistItem', backref='playlist', lazy='dynamic')
+
+    def item_rank(self, item_id):
+        return db.session.query(PlaylistItem.rank).filter(
+                PlaylistItem.playlist_id == self.id, 
+                PlaylistItem.id == item_id).scalar()
+
+    def new_rank(self, before=None, after=None, moving=None):
+        # rank right after item ``after``, right before item ``before`` or at
+        # the end, found with at most two (playlist_id, rank) index lookups.
+        # None when the given item is not in this playlist
+        others = db.session.query(PlaylistItem.rank).filter(
+                    PlaylistItem.playlist_id == self.id)
+        if moving is not None:
+            others = others.filter(PlaylistItem.id != moving)
+        if after is not None:
+            lower = self.item_rank(after)
+            if lower is None:
+                return None
+            upper = others.filter(PlaylistItem.rank > lower).order_by(
+                        PlaylistItem.rank).limit(1).scalar()
+        elif before is not None:
+            upper = self.item_rank(before)
+            if upper is None:
+                return None
+            lower = others.filter(PlaylistItem.rank < upper).order_by(
+                        PlaylistItem.rank.desc()).limit(1).scalar()
+        else:
+            lower = others.order_by(PlaylistItem.rank.desc()).limit(1).scalar()
+            upper = None
+        rank = rank_between(lower, upper)
+        if len(rank) > PlaylistItem.rank.type.length:
+            # too long to store, respace now instead of waiting for the job
+            self.rebalance()
+            return self.new_rank(before, after, moving)
+        if (len(rank) > current_app.config['PLAYLIST_RANK_MAX_LENGTH'] 
+                and not self.needs_rebalance):
+            self.needs_rebalance = True
+        return rank
+
+    def add_item(self, music_item_id, before=None, after=None):
+        rank = self.new_rank(before, after)
+        if rank is None:
+            return None
+        item = PlaylistItem(playlist_id=self.id, music_item_id=music_item_id, 
+                            rank=rank)
+        db.session.add(item)
+        self.item_count = db.func.coalesce(Playlist.item_count, 0) + 1
+        self.updated_at = datetime.utcnow()
+        return item
+
+    def move_item(self, item, before=None, after=None):
+        # only the moved item's row is written
+        rank = self.new_rank(before, after, moving=item.id)
+        if rank is None:
+            return False
+        item.rank = rank
+        return True
+
+    def remove_item(self, item):
+        db.session.delete(item)
+        self.item_count = db.func.coalesce(Playlist.item_count, 0) - 1
+        self.updated_at = datetime.utcnow()
+
+    def rebalance(self):
+        """Rewrites every rank of the playlist to evenly spaced short ones,
+        keeping the order. Returns the number of items."""
+        ids = [id for id, in db.session.query(PlaylistItem.id).filter(
+                PlaylistItem.playlist_id == self.id).order_by(PlaylistItem.rank)]
+        table = PlaylistItem.__table__
+        # park every row on a rank outside the digit range first, otherwise
+        # the unique (playlist_id, rank) trips over ranks not yet rewritten
+        db.session.execute(table.update().where(
+                table.c.playlist_id == self.id).values(
+                    rank=db.literal('~') + db.cast(table.c.id, db.String)))
+        if ids:
+            db.session.execute(table.update().where(
+                    table.c.id == db.bindparam('item_id')).values(
+                        rank=db.bindparam('new_rank')), 
+                    [{'item_id': id, 'new_rank': rank} 
+                     for id, rank in zip(ids, evenly_spaced_ranks(len(ids)))])
+        self.needs_rebalance = False
+        return len(ids)
+
+    @staticmethod 
+    def rebalance_flagged(max_playlists=None):
+        # each playlist is committed on its own, returns how many were done
+        rebalanced = 0
+        while max_playlists is None or rebalanced < max_playlists:
+            playlist = Playlist.query.filter(
+                    Playlist.needs_rebalance == db.true()).first()
+            if playlist is None:
+                break
+            playlist.rebalance()
+            db.session.commit()
+            rebalanced += 1
+        return rebalanced
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'item_count': self.item_count,
+            'created_at': self.created_at.isoformat() + 'Z',
+            'updated_at': self.updated_at.isoformat() + 'Z',
+            '_links': {
+                'self': url_for('api.get_playlist', id=self.id),
+                'items': url_for('api.get_playlist_items', id=self.id)
+            }
+        }
+
+    def __repr__(self):
+        return '<Playlist id={} user_id={} name={}>'.format(
+                self.id, self.user_id, self.name)
+
+class PlaylistItem(db.Model):
+    """Entry of a playlist. Items are ordered by ``rank``, a key from
+    app.ranks, so moving one rewrites only its own row. The same music item
+    may appear more than once."""
+    __table_args__ = (
+        db.UniqueConstraint('playlist_id', 'rank', 
+                            name='uq_playlist_item_playlist_id_rank'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlist.id'), nullable=False)
+    music_item_id = db.Column(db.Integer, db.ForeignKey('music_item.id'), 
+                              nullable=False, index=True)
+    rank = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    music_item = db.relationship('MusicItem')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'rank': self.rank,
+            'music_item': self.music_item.to_dict()
+        }
+
+class ListenEvent(db.Model):
+    """Raw listening session as reported by a client. Append only: rows are
+    bulk inserted, folded into the hourly rollups below by
+    rollup_listen_events and then deleted."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    music_item_id = db.Column(db.Integer, db.ForeignKey('music_item.id'), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    # seconds listened
+    duration = db.Column(db.Integer, nullable=False)
+
+class ListenHourlyMusicItem(db.Model):
+    """Listens and seconds listened of a music item per hour, ``hour`` being
+    the start of the hour in UTC."""
+    __table_args__ = (
+        db.Index('ix_listen_hourly_music_item_hour_music_item_id', 'hour', 'music_item_id'),
+    )
+    music_item_id = db.Column(db.Integer, db.ForeignKey('music_item.id'), primary_key=True)
+    hour = db.Column(db.DateTime, primary_key=True)
+    listens = db.Column(db.Integer, nullable=False)
+    seconds = db.Column(db.Integer, nullable=False)
+
+class ListenHourlyUser(db.Model):
+    """Listens and seconds listened of a user per hour."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    hour = db.Column(db.DateTime, primary_key=True)
+    listens = db.Column(db.Integer, nullable=False)
+    seconds = db.Column(db.Integer, nullable=False)
+
+# columns needed by MusicItem.to_dict, selected by the list fast path
+MUSIC_ITEM_COLUMNS = (MusicItem.id, MusicItem.resource_type, MusicItem.resource_id, 
+                      MusicItem.pin_count, MusicItem.listen_count, MusicItem.private)
+
+def music_item_row_to_dict(row):
+    # must stay in step with MusicItem.to_dict, key order included. Extra
+    # trailing columns (cursor keysets) are ignored
+    id, resource_type, resource_id, pin_count, listen_count, private = row[:6]
+    return {
+        'id': id,
+        'resource_type': resource_type.name,
+        'resource_id': resource_id,
+        'pin_count': pin_count,
+        'listen_count': listen_count,
+        'private': private
+    }
+
+# PlaylistItem.id is labelled, it would otherwise clash with MusicItem.id
+PLAYLIST_ITEM_COLUMNS = (PlaylistItem.id.label('playlist_item_id'), 
+                         PlaylistItem.rank) + MUSIC_ITEM_COLUMNS
+
+def playlist_item_row_to_dict(row):
+    # must stay in step with PlaylistItem.to_dict
+    return {
+        'id': row[0],
+        'rank': row[1],
+        'music_item': music_item_row_to_dict(row[2:])
+    }
+
 # class TodoList(db.Model):
 #     pass 
 
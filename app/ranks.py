@@ -0,0 +1,82 @@
+"""Lexicographic rank keys for ordered lists.
+
+A rank is a string of base 36 digits read as the fraction 0.<digits>, so
+comparing two ranks as strings compares their positions. There is always a
+rank strictly between any two, which lets an item be moved by rewriting its
+own rank only. Ranks never end in '0', otherwise nothing would fit between
+'1' and '10'. Lowercase digits and letters sort the same under every common
+collation.
+"""
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+# appending (prepending) steps up (down) by one unit in the last of this many
+# digits, so a list built from either end keeps ranks this short for about
+# BASE ** APPEND_WIDTH / 2 items
+APPEND_WIDTH = 4
+
+
+def _midpoint(lower, upper):
+    # lower < upper as fractions, lower may be '' (0) and upper None (1)
+    if upper is not None:
+        n = 0
+        while n < len(upper) and (lower[n] if n < len(lower) else '0') == upper[n]:
+            n += 1
+        if n:
+            return upper[:n] + _midpoint(lower[n:], upper[n:])
+    low = DIGITS.index(lower[0]) if lower else 0
+    high = DIGITS.index(upper[0]) if upper is not None else BASE
+    if high - low > 1:
+        return DIGITS[(low + high) // 2]
+    if upper is not None and len(upper) > 1:
+        # the first digit of upper alone is already below upper
+        return upper[0]
+    return DIGITS[low] + _midpoint(lower[1:], None)
+
+
+def _step(rank, delta):
+    # rank plus delta (1 or -1) units in its last digit, at least
+    # APPEND_WIDTH digits long, or None when that leaves the range
+    digits = [DIGITS.index(digit) for digit in rank.ljust(APPEND_WIDTH, '0')]
+    i = len(digits) - 1
+    wrap, reset = (BASE - 1, 0) if delta > 0 else (0, BASE - 1)
+    while i >= 0 and digits[i] == wrap:
+        digits[i] = reset
+        i -= 1
+    if i < 0:
+        return None
+    digits[i] += delta
+    stepped = ''.join(DIGITS[digit] for digit in digits).rstrip('0')
+    # stepping down to 0 leaves nothing below for the next rank
+    return stepped or None
+
+
+def rank_between(before=None, after=None):
+    """A rank sorting after ``before`` and before ``after``, either of which
+    may be None for the start or end of the list."""
+    if before is not None and after is not None and before >= after:
+        raise ValueError('{!r} does not sort before {!r}'.format(before, after))
+    if (before is None) != (after is None):
+        rank = _step(before, 1) if after is None else _step(after, -1)
+        if rank is not None:
+            return rank
+    return _midpoint(before or '', after)
+
+
+def evenly_spaced_ranks(count):
+    """``count`` ascending ranks spread evenly over the middle half of the
+    range, all of the same short length, used to rebalance a list. The
+    quarters below and above are left for prepends and appends."""
+    width = 2
+    while BASE ** width < count * BASE * 2:
+        width += 1
+    step = BASE ** width // (count * 2)
+    ranks = []
+    for i in range(count):
+        value = BASE ** width // 4 + step * i
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        ranks.append(''.join(reversed(digits)).rstrip('0'))
+    return ranks
@@ -0,0 +1,216 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, current_app
+
+
+class MemoryBackend(object):
+    """Per-process LRU store, the default backend."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generation(self):
+        return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+class SQLiteBackend(object):
+    """Store backed by a local SQLite file so that every worker process on a
+    host shares the same entries and generation counter."""
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS response_cache ('
+                         'key TEXT PRIMARY KEY, value BLOB, '
+                         'expires_at REAL, accessed_at REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_response_cache_accessed_at '
+                         'ON response_cache (accessed_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS response_cache_meta ('
+                         'name TEXT PRIMARY KEY, value INTEGER)')
+            conn.execute("INSERT OR IGNORE INTO response_cache_meta (name, value) "
+                         "VALUES ('generation', 0)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute('SELECT value, expires_at FROM response_cache '
+                           'WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        conn.execute('UPDATE response_cache SET accessed_at = ? WHERE key = ?',
+                     (now, key))
+        return bytes(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO response_cache '
+                     '(key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                     (key, sqlite3.Binary(value), now + ttl, now))
+        # evicting on every write would double write cost, trim periodically
+        self._writes += 1
+        if self._writes % 32 == 0:
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute('DELETE FROM response_cache WHERE expires_at <= ?', (now,))
+        conn.execute('DELETE FROM response_cache WHERE key IN ('
+                     'SELECT key FROM response_cache ORDER BY accessed_at DESC '
+                     'LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def generation(self):
+        row = self._connection().execute(
+                "SELECT value FROM response_cache_meta WHERE name = 'generation'"
+            ).fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self):
+        conn = self._connection()
+        conn.execute("UPDATE response_cache_meta SET value = value + 1 "
+                     "WHERE name = 'generation'")
+        conn.execute('DELETE FROM response_cache')
+
+
+class ResponseCache(object):
+    """Caches serialized response bodies for anonymous, shared endpoints.
+
+    Keys include a generation number; ``invalidate`` bumps it so every
+    existing entry becomes unreachable at once. Small changes such as a single
+    pin are reported through ``note_change`` and only invalidate once enough
+    of them have accumulated, otherwise entries simply age out after ``ttl``.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 0
+        self.change_threshold = 1
+        self._pending_changes = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', 30)
+        self.change_threshold = app.config.get('RESPONSE_CACHE_CHANGE_THRESHOLD', 50)
+        max_entries = app.config.get('RESPONSE_CACHE_SIZE', 512)
+        backend = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+        if backend == 'sqlite':
+            self.backend = SQLiteBackend(
+                    app.config['RESPONSE_CACHE_PATH'], max_entries)
+        elif backend == 'memory':
+            self.backend = MemoryBackend(max_entries)
+        else:
+            raise ValueError('Unknown RESPONSE_CACHE_BACKEND {}'.format(backend))
+        self._pending_changes = 0
+
+    @property
+    def enabled(self):
+        return self.backend is not None and self.ttl > 0
+
+    def make_key(self, name):
+        args = sorted(request.args.items(multi=True))
+        return '{}:{}?{}'.format(self.backend.generation(), name,
+                                 '&'.join('{}={}'.format(k, v) for k, v in args))
+
+    def generation(self):
+        return self.backend.generation() if self.backend is not None else 0
+
+    def get(self, key):
+        return self.backend.get(key) if self.enabled else None
+
+    def set(self, key, value):
+        if self.enabled:
+            self.backend.set(key, value, self.ttl)
+
+    def invalidate(self):
+        if self.backend is None:
+            return
+        with self._lock:
+            self._pending_changes = 0
+        self.backend.bump_generation()
+
+    def note_change(self, weight=1):
+        with self._lock:
+            self._pending_changes += weight
+            if self._pending_changes < self.change_threshold:
+                return
+        self.invalidate()
+
+    def cached(self, f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not self.enabled:
+                return f(*args, **kwargs)
+            key = self.make_key(request.endpoint)
+            body = self.get(key)
+            if body is not None:
+                response = current_app.response_class(body, mimetype='application/json')
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.mimetype != 'application/json':
+                    return response
+                self.set(key, response.get_data())
+            return self._compressed(key, response)
+        return decorated
+
+    def _compressed(self, key, response):
+        # compressed variants are cached under their own keys next to the
+        # plain body, so each is produced once per entry rather than per hit
+        compression = current_app.extensions.get('compression')
+        encoding = compression.negotiate(response) if compression else None
+        if encoding is None:
+            return response
+        variant_key = '{}|{}'.format(key, encoding)
+        data = self.get(variant_key)
+        if data is None:
+            data = compression.compress(response.get_data(), encoding)
+            self.set(variant_key, data)
+        compression.apply(response, data, encoding)
+        return response
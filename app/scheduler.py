@@ -0,0 +1,46 @@
+import threading
+
+
+class PeriodicTask(object):
+    """Runs ``func`` inside an application context every ``interval`` seconds
+    on a daemon thread, or sooner when woken. Exceptions are logged and the
+    task keeps running."""
+
+    def __init__(self, app, name, func, interval):
+        self.app = app
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, 
+                                        daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        # run now instead of at the end of the current interval
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            with self.app.app_context():
+                try:
+                    self.func()
+                except Exception:
+                    self.app.logger.exception('Periodic task %s failed', self.name)
@@ -0,0 +1,108 @@
+from itertools import islice
+from app import db
+from app.models import MusicItem, MusicItemSimilarity, user_pinned_music
+
+
+def read_pins(batch_size=100000):
+    """(user ids, music item ids) of every pin on a public item as two int32
+    arrays. Rows are streamed through a server side cursor where the driver
+    supports one and packed ``batch_size`` at a time, so they are never held
+    as Python tuples all at once."""
+    import numpy as np
+    query = db.session.query(user_pinned_music.c.user_id,
+                             user_pinned_music.c.music_item_id).join(
+                MusicItem, MusicItem.id == user_pinned_music.c.music_item_id).filter(
+                    MusicItem.private.isnot(True)).execution_options(
+                        stream_results=True).yield_per(batch_size)
+    rows = iter(query)
+    batches = []
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        batches.append(np.array(batch, dtype=np.int32))
+    if not batches:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+    pins = np.concatenate(batches)
+    return pins[:, 0], pins[:, 1]
+
+
+def build_similarity(top_k=20, chunk_size=1000, batch_size=100000, progress=None):
+    """Rebuilds music_item_similarity from user_pinned_music.
+
+    Pins form a sparse binary user x item matrix A. Cosine similarity between
+    items is (A^T A)[i, j] / sqrt(pins_i * pins_j); it is computed for
+    ``chunk_size`` items at a time, so memory is bounded by the pins plus one
+    chunk of co-occurrences, and only the ``top_k`` neighbours of each item
+    are kept. Each chunk replaces the rows for its id range and is committed
+    on its own. Needs numpy and scipy. Returns the number of rows written.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    user_ids, item_ids = read_pins(batch_size)
+    table = MusicItemSimilarity.__table__
+    if not len(item_ids):
+        db.session.execute(table.delete())
+        db.session.commit()
+        return 0
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    items, item_index = np.unique(item_ids, return_inverse=True)
+    del user_ids, item_ids
+    # users x items, and its transpose for slicing rows of items
+    pins = sparse.csr_matrix(
+            (np.ones(len(item_index), dtype=np.float32), (user_index, item_index)),
+            shape=(len(users), len(items)))
+    del user_index, item_index
+    pins_by_item = pins.T.tocsr()
+    inverse_norms = 1.0 / np.sqrt(np.asarray(pins_by_item.sum(axis=1)).ravel())
+
+    written = 0
+    for start in range(0, len(items), chunk_size):
+        end = min(start + chunk_size, len(items))
+        # chunk x items co-occurrence counts scaled to cosine similarity
+        block = (pins_by_item[start:end] @ pins).tocsr()
+        block = sparse.diags(inverse_norms[start:end]) @ block @ sparse.diags(inverse_norms)
+        block = block.tocsr()
+        rows = []
+        for offset in range(end - start):
+            row_start, row_end = block.indptr[offset], block.indptr[offset + 1]
+            columns = block.indices[row_start:row_end]
+            scores = block.data[row_start:row_end]
+            keep = columns != start + offset
+            columns, scores = columns[keep], scores[keep]
+            if len(scores) > top_k:
+                best = np.argpartition(-scores, top_k)[:top_k]
+                columns, scores = columns[best], scores[best]
+            # highest score first, ties broken by the lower item id
+            order = np.lexsort((items[columns], -scores))
+            music_item_id = int(items[start + offset])
+            rows.extend({'music_item_id': music_item_id, 'rank': rank,
+                         'similar_music_item_id': int(items[columns[i]]),
+                         'score': float(scores[i])}
+                        for rank, i in enumerate(order))
+        # the chunk owns every id from its first item up to the next chunk's
+        # first item, which also clears items that no longer have pins
+        lower = int(items[start]) if start else None
+        upper = int(items[end]) if end < len(items) else None
+        stale = table.delete()
+        if lower is not None:
+            stale = stale.where(table.c.music_item_id >= lower)
+        if upper is not None:
+            stale = stale.where(table.c.music_item_id < upper)
+        db.session.execute(stale)
+        if rows:
+            db.session.execute(table.insert(), rows)
+        db.session.commit()
+        written += len(rows)
+        if progress is not None:
+            progress(end, len(items), written)
+    return written
+
+
+def similar_music_query(music_item_id):
+    return MusicItem.query.join(
+                MusicItemSimilarity,
+                MusicItemSimilarity.similar_music_item_id == MusicItem.id).filter(
+                    MusicItemSimilarity.music_item_id == music_item_id).filter(
+                        MusicItem.private.isnot(True)).order_by(MusicItemSimilarity.rank)
@@ -0,0 +1,66 @@
+import time
+from app.scheduler import PeriodicTask
+
+
+def purge_expired_tokens(app):
+    from app.models import UserToken
+    start = time.time()
+    purged = UserToken.purge_expired(
+            batch_size=app.config.get('TOKEN_PURGE_BATCH_SIZE', 1000))
+    if purged:
+        app.logger.info('Purged %d expired tokens in %.2fs', 
+                        purged, time.time() - start)
+
+
+def update_trending_scores(app):
+    from app.trending import update_trending
+    start = time.time()
+    updated = update_trending(
+            half_life=app.config.get('TRENDING_HALF_LIFE', 86400),
+            listen_weight=app.config.get('TRENDING_LISTEN_WEIGHT', 1.0),
+            pin_weight=app.config.get('TRENDING_PIN_WEIGHT', 5.0),
+            batch_size=app.config.get('TRENDING_BATCH_SIZE', 1000))
+    if updated:
+        app.logger.info('Updated trending scores of %d items in %.2fs', 
+                        updated, time.time() - start)
+
+
+def rebalance_playlists(app):
+    from app.models import Playlist
+    start = time.time()
+    rebalanced = Playlist.rebalance_flagged()
+    if rebalanced:
+        app.logger.info('Rebalanced %d playlists in %.2fs', 
+                        rebalanced, time.time() - start)
+
+
+def rollup_listens(app):
+    from app.listens import rollup_listen_events
+    start = time.time()
+    rolled_up = rollup_listen_events(
+            batch_size=app.config.get('LISTEN_ROLLUP_BATCH_SIZE', 5000))
+    if rolled_up:
+        app.logger.info('Rolled up %d listen events in %.2fs', 
+                        rolled_up, time.time() - start)
+
+
+def start_background_tasks(app):
+    app.periodic_tasks = []
+    if app.config.get('TOKEN_PURGE_INTERVAL'):
+        app.periodic_tasks.append(PeriodicTask(
+                app, 'token-purge', lambda: purge_expired_tokens(app), 
+                app.config['TOKEN_PURGE_INTERVAL']))
+    if app.config.get('TRENDING_INTERVAL'):
+        app.periodic_tasks.append(PeriodicTask(
+                app, 'trending', lambda: update_trending_scores(app), 
+                app.config['TRENDING_INTERVAL']))
+    if app.config.get('PLAYLIST_REBALANCE_INTERVAL'):
+        app.periodic_tasks.append(PeriodicTask(
+                app, 'playlist-rebalance', lambda: rebalance_playlists(app), 
+                app.config['PLAYLIST_REBALANCE_INTERVAL']))
+    if app.config.get('LISTEN_ROLLUP_INTERVAL'):
+        app.periodic_tasks.append(PeriodicTask(
+                app, 'listen-rollup', lambda: rollup_listens(app), 
+                app.config['LISTEN_ROLLUP_INTERVAL']))
+    for task in app.periodic_tasks:
+        task.start()
@@ -0,0 +1,44 @@
+import base64
+import hashlib
+import hmac
+import json
+
+# Signed access tokens have the form ``s.<payload>.<signature>`` where both
+# parts are unpadded urlsafe base64. Opaque tokens are standard base64 and
+# never contain a '.', so the two formats can be told apart without a lookup.
+PREFIX = 's.'
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _sign(message, secret):
+    return hmac.new(secret.encode('utf8'), message.encode('ascii'), 
+                    hashlib.sha256).digest()
+
+
+def is_signed_token(token):
+    return token.startswith(PREFIX)
+
+
+def encode_token(payload, secret):
+    body = _b64encode(json.dumps(payload, separators=(',', ':'), 
+                                 sort_keys=True).encode('utf8'))
+    return PREFIX + body + '.' + _b64encode(_sign(body, secret))
+
+
+def decode_token(token, secret):
+    if not is_signed_token(token):
+        return None
+    try:
+        body, signature = token[len(PREFIX):].split('.')
+        if not hmac.compare_digest(_b64decode(signature), _sign(body, secret)):
+            return None
+        return json.loads(_b64decode(body).decode('utf8'))
+    except (ValueError, TypeError):
+        return None
@@ -0,0 +1,86 @@
+import math
+from datetime import datetime
+from app import db
+from app.models import MusicItem, MusicItemTrend
+
+# scores are relative to this instant, see MusicItemTrend
+TRENDING_EPOCH = datetime(2020, 1, 1)
+
+# keyset of sort=trending, served by ix_music_item_trend_score_music_item_id
+TRENDING_KEYSET = (MusicItemTrend.score, MusicItemTrend.music_item_id)
+
+
+def _logaddexp(a, b):
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def update_trending(half_life=86400, listen_weight=1.0, pin_weight=5.0,
+                    batch_size=1000, now=None):
+    """Adds the listens and pins recorded since the last run to the trending
+    scores of public items, with ``half_life`` seconds of exponential decay.
+
+    Only items whose counts moved are read and written, in committed batches
+    of ``batch_size``. Unpins and other count decreases are not activity, they
+    only update the counts already scored. Returns the number of items whose
+    row was written.
+    """
+    now = now or datetime.utcnow()
+    # log of exp(t / tau), what scaling every older score down comes to
+    offset = (now - TRENDING_EPOCH).total_seconds() * math.log(2) / half_life
+    listen_count = db.func.coalesce(MusicItem.listen_count, 0)
+    pin_count = db.func.coalesce(MusicItem.pin_count, 0)
+    changed = db.session.query(
+                MusicItem.id, listen_count, pin_count, MusicItemTrend.score,
+                MusicItemTrend.listen_count, MusicItemTrend.pin_count).outerjoin(
+                    MusicItemTrend, MusicItemTrend.music_item_id == MusicItem.id).filter(
+                        MusicItem.private.isnot(True)).filter(db.or_(
+                            db.and_(MusicItemTrend.music_item_id.is_(None),
+                                    db.or_(listen_count > 0, pin_count > 0)),
+                            listen_count != MusicItemTrend.listen_count,
+                            pin_count != MusicItemTrend.pin_count)).order_by(
+                                MusicItem.id)
+    trend = MusicItemTrend.__table__
+    update = trend.update().where(
+                trend.c.music_item_id == db.bindparam('item_id')).values(
+                    score=db.bindparam('new_score'),
+                    listen_count=db.bindparam('seen_listens'),
+                    pin_count=db.bindparam('seen_pins'),
+                    updated_at=db.bindparam('scored_at'))
+    updated = 0
+    last_id = 0
+    while True:
+        rows = changed.filter(MusicItem.id > last_id).limit(batch_size).all()
+        if not rows:
+            break
+        inserts, updates = [], []
+        for id, listens, pins, score, scored_listens, scored_pins in rows:
+            scored = score is not None
+            activity = listen_weight * max(listens - (scored_listens or 0), 0) + \
+                pin_weight * max(pins - (scored_pins or 0), 0)
+            if activity > 0:
+                added = math.log(activity) + offset
+                score = added if score is None else _logaddexp(score, added)
+            if not scored:
+                inserts.append({'music_item_id': id, 'score': score,
+                                'listen_count': listens, 'pin_count': pins,
+                                'updated_at': now})
+            else:
+                updates.append({'item_id': id, 'new_score': score,
+                                'seen_listens': listens, 'seen_pins': pins,
+                                'scored_at': now})
+        if inserts:
+            db.session.execute(trend.insert(), inserts)
+        if updates:
+            db.session.execute(update, updates)
+        db.session.commit()
+        updated += len(rows)
+        last_id = rows[-1][0]
+    return updated
+
+
+def trending_query():
+    return MusicItem.query.join(
+                MusicItemTrend, MusicItemTrend.music_item_id == MusicItem.id).filter(
+                    MusicItem.private.isnot(True)).order_by(
+                        *[column.desc() for column in TRENDING_KEYSET])
@@ -0,0 +1,65 @@
+import base64
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+from config import Config
+
+
+def make_config(database_uri=None, **overrides):
+    directory = tempfile.mkdtemp()
+    if database_uri is None:
+        database_uri = 'sqlite:///' + os.path.join(directory, 'bench.db')
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_uri
+        REPLICA_STICKY_PATH = os.path.join(directory, 'replica_sticky.db')
+        TESTING = True
+        DEBUG = True
+
+    for key, value in overrides.items():
+        setattr(BenchmarkConfig, key, value)
+    return BenchmarkConfig
+
+
+def make_app(database_uri=None, **overrides):
+    from app import create_app, db
+    app = create_app(make_config(database_uri, **overrides))
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def basic_auth_header(email, password):
+    credentials = '{}:{}'.format(email, password).encode('utf8')
+    return {'Authorization': 'Basic ' + base64.b64encode(credentials).decode('ascii')}
+
+
+def bearer_header(token):
+    return {'Authorization': 'Bearer ' + token}
+
+
+class QueryCounter(object):
+    """Counts statements sent to an engine while attached."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _before_cursor_execute(self, *args):
+        self.count += 1
+
+    @contextmanager
+    def counting(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', 
+                     self._before_cursor_execute)
+        try:
+            yield self
+        finally:
+            event.remove(self.engine, 'before_cursor_execute', 
+                         self._before_cursor_execute)
@@ -0,0 +1,463 @@
+"""Reproducible load test for every API endpoint.
+
+Builds the app with create_app against a fresh SQLite file (or the database
+given with --database-uri, which must be empty), seeds users, tokens, music
+items, pins, playlists and rolled up listens, then drives each route from
+concurrent threads through the WSGI test client. Reports throughput, p50/p95/p99 latency and SQL queries per
+request (from the Server-Timing header, or the metrics recorded after a
+streamed body) and writes the results as JSON.
+
+    $ python -m benchmarks.load_test --items 20000 --users 200 --output run.json
+    $ python -m benchmarks.load_test --compare run.json
+
+With --compare the run is checked against an earlier results file and the
+process exits non-zero when any route got slower or issued more queries than
+--threshold allows.
+"""
+import argparse
+import itertools
+import json
+import platform
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from benchmarks.common import make_app, basic_auth_header, bearer_header
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+PASSWORD = 'load-test'
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def seed(app, args):
+    from app import db
+    from app.catalog import import_music_items
+    from app.dialects import insert_ignore, execute_insert_ignore
+    from app.listens import write_listen_events, rollup_listen_events
+    from app.models import (MusicItem, Playlist, PlaylistItem, User, UserToken, 
+                            user_pinned_music)
+    from app.ranks import evenly_spaced_ranks
+    from app.similarity import build_similarity
+    from app.trending import update_trending
+    rng = random.Random(args.seed)
+    with app.app_context():
+        import_music_items(({'resource_type': rng.choice(('youtube', 'soundcloud')),
+                             'resource_id': 'load{}'.format(i),
+                             'listen_count': rng.randint(0, 100000),
+                             'private': False} for i in range(args.items)),
+                           chunk_size=5000)
+        password_hash = User()
+        password_hash.set_password(PASSWORD)
+        db.session.execute(User.__table__.insert(), [
+                {'email': 'load{}@example.com'.format(i),
+                 'password_hash': password_hash.password_hash}
+                for i in range(args.users)])
+        user_ids = [row.id for row in db.session.query(User.id)]
+        item_ids = [row.id for row in db.session.query(MusicItem.id)]
+        # expired token history, the volume real login traffic leaves behind
+        expired = datetime.utcnow() - timedelta(days=1)
+        tokens = ({'user_id': user_id, 'token_type': token_type,
+                   'token': 'expired-{}-{}-{}'.format(user_id, token_type, n),
+                   'expiration': expired}
+                  for user_id in user_ids
+                  for n in range(args.tokens_per_user)
+                  for token_type in ('access', 'refresh'))
+        while True:
+            chunk = list(itertools.islice(tokens, 5000))
+            if not chunk:
+                break
+            db.session.execute(UserToken.__table__.insert(), chunk)
+        pins = [{'user_id': user_id, 'music_item_id': music_item_id}
+                for user_id in user_ids
+                for music_item_id in rng.sample(item_ids, min(args.pins_per_user, len(item_ids)))]
+        for start in range(0, len(pins), 5000):
+            execute_insert_ignore(db.session, insert_ignore(user_pinned_music, db.session.get_bind()),
+                                  pins[start:start + 5000])
+        MusicItem.recount_pins(item_ids)
+        db.session.execute(User.__table__.update().values(
+                pinned_count=db.select([db.func.count()]).where(
+                    user_pinned_music.c.user_id == User.__table__.c.id).as_scalar()))
+        # one playlist per user, the one the playlist routes work on
+        if args.playlist_items:
+            db.session.execute(Playlist.__table__.insert(), [
+                    {'user_id': user_id, 'name': 'load', 'item_count': args.playlist_items}
+                    for user_id in user_ids])
+            ranks = evenly_spaced_ranks(args.playlist_items)
+            for playlist_id, in db.session.query(Playlist.id):
+                db.session.execute(PlaylistItem.__table__.insert(), [
+                        {'playlist_id': playlist_id, 'music_item_id': music_item_id,
+                         'rank': rank} for rank, music_item_id in
+                        zip(ranks, rng.sample(item_ids, min(len(ranks), len(item_ids))))])
+        # a week of listen events, rolled up for the stats routes
+        now = datetime.utcnow()
+        write_listen_events([{'user_id': user_id, 'music_item_id': rng.choice(item_ids),
+                              'started_at': now - timedelta(seconds=rng.randint(0, 7 * 86400)),
+                              'duration': rng.randint(30, 600)}
+                             for user_id in user_ids for _ in range(args.listens_per_user)])
+        db.session.commit()
+        rollup_listen_events()
+        update_trending()
+        try:
+            build_similarity()
+        except ImportError:
+            # numpy and scipy are optional, /similar then answers with no items
+            pass
+        return user_ids, item_ids
+
+
+class Worker(object):
+    """Per thread client and login state, so token rotation and pin/unpin
+    pairs never interfere between threads."""
+
+    def __init__(self, app, index, item_ids, seed):
+        self.client = app.test_client()
+        self.index = index
+        self.email = 'load{}@example.com'.format(index)
+        self.rng = random.Random(seed * 1000 + index)
+        self.item_ids = item_ids
+        self.counter = itertools.count()
+        self.playlist_id = None
+        self.playlist_items = []
+        self.login()
+
+    def login(self):
+        tokens = self.client.post('/tokens', headers=basic_auth_header(self.email, PASSWORD)).json
+        self.access_token = tokens['access_token']
+        self.refresh_token = tokens['refresh_token']
+
+    @property
+    def auth(self):
+        return bearer_header(self.access_token)
+
+    def item(self):
+        return self.rng.choice(self.item_ids)
+
+    def playlist(self):
+        """Id of the user's seeded playlist, its item ids looked up once
+        into ``playlist_items``."""
+        if self.playlist_id is None:
+            playlists = self.client.get('/playlists?cursor=&per_page=50', headers=self.auth).json
+            self.playlist_id = next(playlist['id'] for playlist in playlists['items']
+                                    if playlist['name'] == 'load')
+            cursor = ''
+            while cursor is not None:
+                page = self.client.get('/playlists/{}/items'.format(self.playlist_id),
+                                       query_string={'cursor': cursor, 'per_page': 50},
+                                       headers=self.auth).json
+                self.playlist_items.extend(item['id'] for item in page['items'])
+                cursor = page['_meta']['next_cursor']
+        return self.playlist_id
+
+
+def timed(request):
+    """Runs ``request()`` and returns (response, seconds), body included."""
+    start = time.perf_counter()
+    response = request()
+    response.get_data()
+    return response, time.perf_counter() - start
+
+
+def single(call):
+    return lambda worker: timed(lambda: call(worker))
+
+
+def scenarios(user_ids):
+    """name -> function(worker) returning (response, seconds). Routes that
+    need two calls (pin then unpin, create then delete) make the setup call
+    untimed and only time the named one."""
+
+    def pin(worker):
+        worker.pinned = worker.item()
+        worker.client.delete('/music/pinned/{}'.format(worker.pinned), headers=worker.auth)
+        return timed(lambda: worker.client.post(
+            '/music/pinned/{}'.format(worker.pinned), headers=worker.auth))
+
+    def unpin(worker):
+        music_item_id = worker.item()
+        worker.client.post('/music/pinned/{}'.format(music_item_id), headers=worker.auth)
+        return timed(lambda: worker.client.delete(
+            '/music/pinned/{}'.format(music_item_id), headers=worker.auth))
+
+    def refresh(worker):
+        response, seconds = timed(lambda: worker.client.post(
+            '/tokens/refresh', headers=bearer_header(worker.refresh_token)))
+        if response.status_code == 200:
+            worker.access_token = response.json['access_token']
+            worker.refresh_token = response.json['refresh_token']
+        return response, seconds
+
+    def revoke(worker):
+        result = timed(lambda: worker.client.delete('/tokens', headers=worker.auth))
+        worker.login()
+        return result
+
+    def post_private(worker):
+        return worker.client.post('/music/private', headers=worker.auth, json={
+            'resource_type': 'youtube',
+            'resource_id': 'private-{}-{}'.format(worker.index, next(worker.counter))})
+
+    def remove_private(worker):
+        post_private(worker)
+        newest = worker.client.get('/music/private?cursor=&per_page=1', headers=worker.auth).json
+        return timed(lambda: worker.client.delete(
+            '/music/private/{}'.format(newest['items'][0]['id']), headers=worker.auth))
+
+    def ids(worker, count=20):
+        return [worker.item() for _ in range(count)]
+
+    def create_playlist(worker):
+        result = timed(lambda: worker.client.post(
+            '/playlists', json={'name': 'scratch'}, headers=worker.auth))
+        if result[0].status_code == 201:
+            worker.client.delete('/playlists/{}'.format(result[0].json['id']), headers=worker.auth)
+        return result
+
+    def delete_playlist(worker):
+        created = worker.client.post('/playlists', json={'name': 'scratch'}, headers=worker.auth).json
+        return timed(lambda: worker.client.delete(
+            '/playlists/{}'.format(created['id']), headers=worker.auth))
+
+    def add_playlist_item(worker):
+        playlist_id = worker.playlist()
+        result = timed(lambda: worker.client.post(
+            '/playlists/{}/items'.format(playlist_id), headers=worker.auth,
+            json={'music_item_id': worker.item()}))
+        if result[0].status_code == 201:
+            worker.client.delete('/playlists/{}/items/{}'.format(
+                playlist_id, result[0].json['id']), headers=worker.auth)
+        return result
+
+    def move_playlist_item(worker):
+        playlist_id = worker.playlist()
+        item_id, anchor = worker.rng.sample(worker.playlist_items, 2)
+        return timed(lambda: worker.client.patch(
+            '/playlists/{}/items/{}'.format(playlist_id, item_id),
+            json={'before': anchor}, headers=worker.auth))
+
+    def remove_playlist_item(worker):
+        playlist_id = worker.playlist()
+        added = worker.client.post('/playlists/{}/items'.format(playlist_id), headers=worker.auth,
+                                   json={'music_item_id': worker.item()}).json
+        return timed(lambda: worker.client.delete(
+            '/playlists/{}/items/{}'.format(playlist_id, added['id']), headers=worker.auth))
+
+    def listen_events(worker, count=20):
+        now = datetime.utcnow()
+        return worker.client.post('/music/listens/events', headers=worker.auth, json={
+            'events': [{'music_item_id': worker.item(),
+                        'started_at': (now - timedelta(minutes=i)).isoformat() + 'Z',
+                        'duration': worker.rng.randint(30, 600)} for i in range(count)]})
+
+    return [
+        ('POST /users', single(lambda w: w.client.post('/users', json={
+            'email': 'new-{}-{}@example.com'.format(w.index, next(w.counter)),
+            'password': PASSWORD}))),
+        ('GET /users/<id>', single(lambda w: w.client.get(
+            '/users/{}'.format(w.rng.choice(user_ids)), headers=w.auth))),
+        ('POST /tokens', single(lambda w: w.client.post(
+            '/tokens', headers=basic_auth_header(w.email, PASSWORD)))),
+        ('POST /tokens/refresh', refresh),
+        ('DELETE /tokens', revoke),
+        ('GET /music/default', single(lambda w: w.client.get(
+            '/music/default?page={}&per_page=20'.format(w.rng.randint(1, 50))))),
+        ('GET /music/default cursor', single(lambda w: w.client.get(
+            '/music/default?cursor=&per_page=20'))),
+        ('GET /music/default trending', single(lambda w: w.client.get(
+            '/music/default?sort=trending&page={}&per_page=20'.format(w.rng.randint(1, 50))))),
+        ('GET /music/home', single(lambda w: w.client.get(
+            '/music/home?page={}'.format(w.rng.randint(1, 20)), headers=w.auth))),
+        ('GET /music/home recommended', single(lambda w: w.client.get(
+            '/music/home?sort=recommended&page={}'.format(w.rng.randint(1, 5)), headers=w.auth))),
+        ('GET /music/pinned', single(lambda w: w.client.get('/music/pinned', headers=w.auth))),
+        ('GET /music/private', single(lambda w: w.client.get('/music/private', headers=w.auth))),
+        ('GET /music/items', single(lambda w: w.client.get(
+            '/music/items?ids=' + ','.join(str(id) for id in ids(w)), headers=w.auth))),
+        ('POST /music/pinned/<id>', pin),
+        ('DELETE /music/pinned/<id>', unpin),
+        ('POST /music/pinned/batch', single(lambda w: w.client.post(
+            '/music/pinned/batch', json={'ids': ids(w)}, headers=w.auth))),
+        ('DELETE /music/pinned/batch', single(lambda w: w.client.delete(
+            '/music/pinned/batch', json={'ids': ids(w)}, headers=w.auth))),
+        ('POST /music/private', single(post_private)),
+        ('DELETE /music/private/<id>', remove_private),
+        ('GET /music/<id>/similar', single(lambda w: w.client.get(
+            '/music/{}/similar'.format(w.item())))),
+        ('POST /music/<id>/listen', single(lambda w: w.client.post(
+            '/music/{}/listen'.format(w.item()), headers=w.auth))),
+        ('POST /music/listens', single(lambda w: w.client.post(
+            '/music/listens', headers=w.auth, json={'ids': ids(w, 50)}))),
+        ('POST /music/listens/events', single(listen_events)),
+        ('GET /stats/listening', single(lambda w: w.client.get(
+            '/stats/listening', headers=w.auth))),
+        ('GET /stats/music/<id>', single(lambda w: w.client.get(
+            '/stats/music/{}'.format(w.item())))),
+        ('GET /stats/music/top', single(lambda w: w.client.get('/stats/music/top'))),
+        ('GET /playlists', single(lambda w: w.client.get('/playlists', headers=w.auth))),
+        ('POST /playlists', create_playlist),
+        ('GET /playlists/<id>', single(lambda w: w.client.get(
+            '/playlists/{}'.format(w.playlist()), headers=w.auth))),
+        ('PUT /playlists/<id>', single(lambda w: w.client.put(
+            '/playlists/{}'.format(w.playlist()), json={'name': 'load'}, headers=w.auth))),
+        ('DELETE /playlists/<id>', delete_playlist),
+        ('GET /playlists/<id>/items', single(lambda w: w.client.get(
+            '/playlists/{}/items?cursor=&per_page=20'.format(w.playlist()), headers=w.auth))),
+        ('POST /playlists/<id>/items', add_playlist_item),
+        ('PATCH /playlists/<id>/items/<id>', move_playlist_item),
+        ('DELETE /playlists/<id>/items/<id>', remove_playlist_item),
+        ('GET /export/music', single(lambda w: w.client.get('/export/music', headers=w.auth))),
+        ('GET /export/music/pinned', single(lambda w: w.client.get(
+            '/export/music/pinned', headers=w.auth))),
+        ('GET /export/music/private', single(lambda w: w.client.get(
+            '/export/music/private', headers=w.auth))),
+        ('GET /metrics', single(lambda w: w.client.get('/metrics'))),
+    ]
+
+
+def run_scenario(workers, scenario, requests):
+    from app.metrics import last_request_stats
+    latencies = []
+    queries = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = itertools.count()
+
+    def drive(worker):
+        local_latencies = []
+        local_queries = []
+        local_errors = 0
+        while next(remaining) < requests:
+            response, seconds = scenario(worker)
+            local_latencies.append(seconds)
+            if response.status_code >= 400:
+                local_errors += 1
+            match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+            if match:
+                local_queries.append(int(match.group(1)))
+            else:
+                # streamed, recorded on this thread once the body was read
+                local_queries.append(last_request_stats()[0])
+        with lock:
+            latencies.extend(local_latencies)
+            queries.extend(local_queries)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=drive, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # requests per second of timed time per thread, so untimed setup calls
+    # of two call scenarios do not count against the route
+    busy = sum(latencies) / len(workers) if workers else 0.0
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput': len(latencies) / busy if busy else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'queries_per_request': sum(queries) / float(len(queries)) if queries else None
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print('\nCompared with {}'.format(baseline['meta'].get('started')))
+    for name, current in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        p95_change = (current['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] \
+            if previous['p95_ms'] else 0.0
+        # cached routes average fractions of a query, ignore small drift
+        previous_queries = previous['queries_per_request'] or 0
+        more_queries = (current['queries_per_request'] or 0) > \
+            previous_queries + max(0.5, previous_queries * threshold)
+        flag = ''
+        if p95_change > threshold or more_queries:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('{:<34} p95 {:+7.1%}  queries {} -> {}{}'.format(
+            name, p95_change, _fmt_queries(previous['queries_per_request']),
+            _fmt_queries(current['queries_per_request']), flag))
+    return regressions
+
+
+def _fmt_queries(value):
+    return '-' if value is None else '{:.2f}'.format(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--pins-per-user', type=int, default=20)
+    parser.add_argument('--tokens-per-user', type=int, default=10)
+    parser.add_argument('--playlist-items', type=int, default=100)
+    parser.add_argument('--listens-per-user', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=400, help='requests per route')
+    parser.add_argument('--routes', default=None, help='only routes containing this text')
+    parser.add_argument('--no-response-cache', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', default=None)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed relative p95 increase before flagging a regression')
+    args = parser.parse_args()
+
+    overrides = {'METRICS_SERVER_TIMING': True}
+    if args.no_response_cache:
+        overrides['RESPONSE_CACHE_TTL'] = 0
+    app = make_app(args.database_uri, **overrides)
+    seed_start = time.perf_counter()
+    user_ids, item_ids = seed(app, args)
+    print('Seeded {} items, {} users in {:.1f}s'.format(
+        len(item_ids), len(user_ids), time.perf_counter() - seed_start))
+
+    workers = [Worker(app, index, item_ids, args.seed)
+               for index in range(min(args.concurrency, len(user_ids)))]
+    results = {}
+    print('{:<34} {:>8} {:>6} {:>9} {:>8} {:>8} {:>8} {:>8}'.format(
+        'route', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+    for name, scenario in scenarios(user_ids):
+        if args.routes and args.routes not in name:
+            continue
+        result = results[name] = run_scenario(workers, scenario, args.requests)
+        print('{:<34} {requests:>8} {errors:>6} {throughput:>9.1f} {p50_ms:>8.2f} '
+              '{p95_ms:>8.2f} {p99_ms:>8.2f} {queries:>8}'.format(
+                  name, queries=_fmt_queries(result['queries_per_request']), **result))
+
+    report = {
+        'meta': {
+            'started': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'database': 'sqlite (temporary)' if args.database_uri is None else args.database_uri.split(':')[0],
+            'args': {key: value for key, value in vars(args).items()
+                     if key not in ('output', 'compare', 'database_uri')}
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print('Results written to {}'.format(args.output))
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
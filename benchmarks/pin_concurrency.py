@@ -0,0 +1,81 @@
+"""Hammers pin/unpin of a single music item from many threads and checks
+that music_item.pin_count, user.pinned_count and the user_pinned_music rows
+still agree afterwards. Exits non-zero on any mismatch.
+
+    $ python -m benchmarks.pin_concurrency --threads 16 --requests 200
+"""
+import argparse
+import random
+import sys
+import threading
+from benchmarks.common import make_app, basic_auth_header, bearer_header
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, 
+                        help='pin/unpin requests per thread')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--database-uri', default=None)
+    args = parser.parse_args()
+
+    from app import db
+    from app.models import MusicItem, User, user_pinned_music
+    app = make_app(args.database_uri)
+    client = app.test_client()
+    with app.app_context():
+        music_item = MusicItem()
+        music_item.from_dict({'resource_type': 'youtube', 'resource_id': 'hot'})
+        db.session.add(music_item)
+        db.session.commit()
+        music_item_id = music_item.id
+
+    headers = []
+    for i in range(args.users):
+        email = 'user{}@example.com'.format(i)
+        client.post('/users', json={'email': email, 'password': 'pw'})
+        tokens = client.post('/tokens', headers=basic_auth_header(email, 'pw')).json
+        headers.append(bearer_header(tokens['access_token']))
+
+    url = '/music/pinned/{}'.format(music_item_id)
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        thread_client = app.test_client()
+        for _ in range(args.requests):
+            method = rng.choice(('post', 'delete'))
+            response = getattr(thread_client, method)(url, headers=rng.choice(headers))
+            with lock:
+                key = (method, response.status_code)
+                statuses[key] = statuses.get(key, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(seed,)) 
+                for seed in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        rows = db.session.query(db.func.count()).select_from(user_pinned_music).filter(
+                user_pinned_music.c.music_item_id == music_item_id).scalar()
+        pin_count = MusicItem.query.get(music_item_id).pin_count
+        users_ok = all(
+            (user.pinned_count or 0) == user.pinned_music.count() 
+            for user in User.query)
+
+    for (method, status), count in sorted(statuses.items()):
+        print('{:<7} {} x{}'.format(method.upper(), status, count))
+    print('association rows {}, pin_count {}, user counters consistent {}'.format(
+            rows, pin_count, users_ok))
+    if rows != pin_count or not users_ok or any(
+            status >= 500 for _, status in statuses):
+        print('MISMATCH')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Moves items around a 10k item playlist through PATCH
+/playlists/<id>/items/<item_id> and reports latency, statements and rows
+written per move, next to renumbering integer positions for the same moves.
+Then keeps moving items to one spot, the worst case for rank length, and
+times the rebalance. Exits non-zero if the final order is not the expected
+one.
+
+    $ python -m benchmarks.playlist_reorder --items 10000 --moves 500
+"""
+import argparse
+import random
+import sys
+import time
+from sqlalchemy import event
+from benchmarks.common import make_app, basic_auth_header, bearer_header
+from benchmarks.load_test import percentile
+
+
+class WriteCounter(object):
+    """Statements and rows written (INSERT, UPDATE, DELETE) while attached."""
+
+    def __init__(self, engine):
+        self.statements = 0
+        self.rows = 0
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _after_cursor_execute(self, conn, cursor, statement, *args):
+        self.statements += 1
+        if statement.lstrip().split(None, 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            self.rows += max(cursor.rowcount, 0)
+
+    def reset(self):
+        self.statements = self.rows = 0
+
+
+def report(label, latencies, statements, rows, moves):
+    latencies = sorted(latencies)
+    print('{:<28} p50 {:>7.2f}ms  p95 {:>7.2f}ms  {:>5.1f} statements  {:>8.1f} rows written / move'.format(
+            label, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.95) * 1000,
+            statements / moves, rows / moves))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--moves', type=int, default=500)
+    parser.add_argument('--hotspot-moves', type=int, default=300,
+                        help='moves to the same spot, growing its ranks')
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from app import db
+    from app.catalog import import_music_items
+    from app.models import MusicItem, Playlist, PlaylistItem
+    from app.ranks import evenly_spaced_ranks
+    app = make_app(args.database_uri, PLAYLIST_RANK_MAX_LENGTH=24,
+                   MAX_PLAYLIST_ITEMS=args.items + 1)
+    client = app.test_client()
+    client.post('/users', json={'email': 'bench@example.com', 'password': 'pw'})
+    tokens = client.post('/tokens', headers=basic_auth_header('bench@example.com', 'pw')).json
+    headers = bearer_header(tokens['access_token'])
+    playlist_id = client.post('/playlists', json={'name': 'bench'}, headers=headers).json['id']
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        import_music_items([{'resource_type': 'youtube', 'resource_id': 'v{}'.format(i),
+                             'listen_count': 0, 'private': False} for i in range(1000)])
+        music_item_ids = [id for id, in db.session.query(MusicItem.id)]
+        ranks = evenly_spaced_ranks(args.items)
+        # a second copy of the playlist, moved through the model directly
+        copy = Playlist(user_id=Playlist.query.get(playlist_id).user_id, name='copy')
+        db.session.add(copy)
+        db.session.flush()
+        copy_id = copy.id
+        for id in (playlist_id, copy_id):
+            db.session.execute(PlaylistItem.__table__.insert(), [
+                    {'playlist_id': id, 'music_item_id': rng.choice(music_item_ids),
+                     'rank': rank} for rank in ranks])
+            Playlist.query.get(id).item_count = args.items
+
+        def ordered_ids(id):
+            return [item_id for item_id, in db.session.query(PlaylistItem.id).filter_by(
+                    playlist_id=id).order_by(PlaylistItem.rank)]
+        order = ordered_ids(playlist_id)
+        copy_ids = dict(zip(order, ordered_ids(copy_id)))
+        # integer positions for the same playlist, renumbered on every move
+        db.session.execute(db.text(
+                'CREATE TABLE bench_position (id INTEGER PRIMARY KEY, '
+                'playlist_id INTEGER, position INTEGER)'))
+        db.session.execute(db.text('CREATE INDEX ix_bench_position '
+                                   'ON bench_position (playlist_id, position)'))
+        db.session.execute(db.text('INSERT INTO bench_position VALUES (:id, :playlist_id, :position)'),
+                [{'id': id, 'playlist_id': playlist_id, 'position': position}
+                 for position, id in enumerate(order)])
+        db.session.commit()
+        counter = WriteCounter(db.engine)
+
+    def move(item_id, before=None, after=None):
+        body = {'before': before} if before is not None else {'after': after}
+        response = client.patch('/playlists/{}/items/{}'.format(playlist_id, item_id),
+                                json=body, headers=headers)
+        if response.status_code != 200:
+            print('move failed: {} {}'.format(response.status_code, response.get_json()))
+            sys.exit(1)
+        order.remove(item_id)
+        if before is not None:
+            order.insert(order.index(before), item_id)
+        else:
+            order.insert(order.index(after) + 1, item_id)
+
+    plan = []
+    for _ in range(args.moves):
+        item_id, anchor = rng.sample(order, 2)
+        plan.append((item_id, anchor, rng.random() < 0.5))
+
+    latencies = []
+    counter.reset()
+    for item_id, anchor, before in plan:
+        start = time.perf_counter()
+        move(item_id, before=anchor if before else None, after=None if before else anchor)
+        latencies.append(time.perf_counter() - start)
+    report('PATCH, whole request', latencies, counter.statements, counter.rows, args.moves)
+    expected = list(order)
+
+    # the same moves replayed on the copy, then as integer positions
+    with app.app_context():
+        latencies = []
+        counter.reset()
+        for item_id, anchor, before in plan:
+            start = time.perf_counter()
+            playlist = Playlist.query.get(copy_id)
+            item = PlaylistItem.query.get(copy_ids[item_id])
+            playlist.move_item(item, before=copy_ids[anchor] if before else None,
+                               after=None if before else copy_ids[anchor])
+            db.session.commit()
+            latencies.append(time.perf_counter() - start)
+        report('rank keys', latencies, counter.statements, counter.rows, args.moves)
+        copied = ordered_ids(copy_id)
+
+        latencies = []
+        counter.reset()
+        for item_id, anchor, before in plan:
+            start = time.perf_counter()
+            positions = dict(db.session.execute(db.text(
+                    'SELECT id, position FROM bench_position WHERE id IN (:a, :b)'),
+                    {'a': item_id, 'b': anchor}).fetchall())
+            source, target = positions[item_id], positions[anchor]
+            if not before:
+                target += 1
+            if target > source:
+                target -= 1
+                db.session.execute(db.text(
+                        'UPDATE bench_position SET position = position - 1 WHERE '
+                        'playlist_id = :p AND position > :s AND position <= :t'),
+                        {'p': playlist_id, 's': source, 't': target})
+            else:
+                db.session.execute(db.text(
+                        'UPDATE bench_position SET position = position + 1 WHERE '
+                        'playlist_id = :p AND position >= :t AND position < :s'),
+                        {'p': playlist_id, 's': source, 't': target})
+            db.session.execute(db.text('UPDATE bench_position SET position = :t WHERE id = :id'),
+                               {'t': target, 'id': item_id})
+            db.session.commit()
+            latencies.append(time.perf_counter() - start)
+        report('integer positions', latencies, counter.statements, counter.rows, args.moves)
+        positions = [id for id, in db.session.execute(db.text(
+                'SELECT id FROM bench_position ORDER BY position'))]
+
+    # always right after the same item: every move halves the same gap
+    anchor = order[len(order) // 2]
+    for _ in range(args.hotspot_moves):
+        item_id = rng.choice(order)
+        if item_id != anchor:
+            move(item_id, after=anchor)
+    with app.app_context():
+        longest = db.session.query(db.func.max(db.func.length(PlaylistItem.rank))).scalar()
+        playlist = Playlist.query.get(playlist_id)
+        print('{} moves to one spot: longest rank {} characters, flagged for rebalance: {}'.format(
+                args.hotspot_moves, longest, playlist.needs_rebalance))
+        start = time.perf_counter()
+        rebalanced = Playlist.rebalance_flagged()
+        elapsed = time.perf_counter() - start
+        longest = db.session.query(db.func.max(db.func.length(PlaylistItem.rank))).scalar()
+        print('rebalanced {} playlist(s) in {:.0f}ms, longest rank now {} characters'.format(
+                rebalanced, elapsed * 1000, longest))
+
+    listed, cursor = [], None
+    while True:
+        page = client.get('/playlists/{}/items'.format(playlist_id), headers=headers,
+                          query_string={'per_page': 50, 'cursor': cursor or ''}).json
+        listed.extend(item['id'] for item in page['items'])
+        cursor = page['_meta']['next_cursor']
+        if not cursor:
+            break
+    if listed != order:
+        print('order mismatch: {} items listed, {} expected'.format(len(listed), len(order)))
+        sys.exit(1)
+    if positions != expected or copied != [copy_ids[id] for id in expected]:
+        print('replayed moves do not give the same order')
+        sys.exit(1)
+    print('order after {} moves and a rebalance matches'.format(
+            args.moves + args.hotspot_moves))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Checks read/write splitting locally with two SQLite files.
+
+The primary is seeded and copied to the replica file, standing in for
+replication. Afterwards the replica is only refreshed when the script says
+so, which makes it easy to see which database a response was read from.
+Exits non-zero if any check fails.
+
+    $ python -m benchmarks.replica_routing --sticky-seconds 1
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from benchmarks.common import make_app, basic_auth_header, bearer_header, QueryCounter
+
+
+def replicate(primary_path, replica_path):
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sticky-seconds', type=int, default=1)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    primary_path = os.path.join(directory, 'primary.db')
+    replica_path = os.path.join(directory, 'replica.db')
+    app = make_app('sqlite:///' + primary_path,
+                   REPLICA_DATABASE_URIS=['sqlite:///' + replica_path],
+                   REPLICA_STICKY_SECONDS=args.sticky_seconds,
+                   RESPONSE_CACHE_TTL=0, TOKEN_CACHE_TTL=0)
+    client = app.test_client()
+
+    from app import db
+    from app.catalog import import_music_items
+    with app.app_context():
+        import_music_items({'resource_type': 'youtube', 'resource_id': 'replica{}'.format(i),
+                            'listen_count': i, 'private': False}
+                           for i in range(50))
+        primary = QueryCounter(db.get_engine(app))
+        replica = QueryCounter(db.get_engine(app, bind='replica0'))
+    client.post('/users', json={'email': 'reader@example.com', 'password': 'pw'})
+    replicate(primary_path, replica_path)
+
+    failures = []
+
+    def request(method, url, **kwargs):
+        with primary.counting(), replica.counting():
+            response = getattr(client, method)(url, **kwargs)
+        return response, primary.count, replica.count
+
+    def check(name, ok, detail):
+        print('{:<4} {:<62} {}'.format('ok' if ok else 'FAIL', name, detail))
+        if not ok:
+            failures.append(name)
+
+    response, on_primary, on_replica = request('post', '/tokens',
+        headers=basic_auth_header('reader@example.com', 'pw'))
+    check('token issuance writes to the primary',
+          response.status_code == 200 and on_primary and not on_replica,
+          'primary {} replica {}'.format(on_primary, on_replica))
+    auth = bearer_header(response.json['access_token'])
+
+    response, on_primary, on_replica = request('get', '/music/default')
+    check('anonymous catalog reads from the replica',
+          response.status_code == 200 and on_replica and not on_primary,
+          'primary {} replica {}'.format(on_primary, on_replica))
+
+    response, on_primary, on_replica = request('get', '/music/pinned', headers=auth)
+    check('reads right after login stay on the primary',
+          response.status_code == 200 and on_primary and not on_replica,
+          'primary {} replica {}'.format(on_primary, on_replica))
+
+    time.sleep(args.sticky_seconds + 0.1)
+    response, on_primary, on_replica = request('get', '/music/pinned', headers=auth)
+    check('token authenticates on the primary, list reads from the replica',
+          response.status_code == 200 and on_primary and on_replica,
+          'primary {} replica {}'.format(on_primary, on_replica))
+
+    response, on_primary, on_replica = request('post', '/music/pinned/1', headers=auth)
+    check('pin writes to the primary',
+          response.status_code == 200 and on_primary and not on_replica,
+          'primary {} replica {}'.format(on_primary, on_replica))
+
+    response, on_primary, on_replica = request('get', '/music/pinned', headers=auth)
+    check('reads right after a write stay on the primary',
+          len(response.json['items']) == 1 and not on_replica,
+          'items {} primary {} replica {}'.format(
+              len(response.json['items']), on_primary, on_replica))
+
+    time.sleep(args.sticky_seconds + 0.1)
+    response, on_primary, on_replica = request('get', '/music/pinned', headers=auth)
+    check('after the sticky window reads go back to the (stale) replica',
+          len(response.json['items']) == 0 and on_replica,
+          'items {} primary {} replica {}'.format(
+              len(response.json['items']), on_primary, on_replica))
+
+    replicate(primary_path, replica_path)
+    response, on_primary, on_replica = request('get', '/music/pinned', headers=auth)
+    check('replica shows the pin once it has caught up',
+          len(response.json['items']) == 1 and on_replica,
+          'items {} primary {} replica {}'.format(
+              len(response.json['items']), on_primary, on_replica))
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
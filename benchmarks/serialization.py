@@ -0,0 +1,63 @@
+"""Compares the ORM list serialization path with the column projected fast
+path for one page of /music/default and checks the bytes are identical.
+
+    $ python -m benchmarks.serialization --items 5000 --per-page 100
+"""
+import argparse
+import sys
+import timeit
+from benchmarks.common import make_app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    from flask import jsonify
+    from app import db
+    from app.catalog import import_music_items
+    from app.models import MusicItem, MUSIC_ITEM_COLUMNS, music_item_row_to_dict
+    from app.api.routes import json_response
+    app = make_app()
+    with app.app_context():
+        import_music_items({'resource_type': 'youtube', 
+                            'resource_id': 'item{}'.format(i), 
+                            'listen_count': i % 997, 'private': False} 
+                           for i in range(args.items))
+
+    def orm_path():
+        query = MusicItem.query.order_by(MusicItem.listen_count.desc(), 
+                                         MusicItem.id.desc())
+        return jsonify(MusicItem.to_collection_dict(
+                query, 2, args.per_page, 'api.get_default_music_list', 
+                total=args.items)).get_data()
+
+    def fast_path():
+        query = MusicItem.query.order_by(MusicItem.listen_count.desc(), 
+                                         MusicItem.id.desc())
+        return json_response(MusicItem.to_collection_dict(
+                query, 2, args.per_page, 'api.get_default_music_list', 
+                total=args.items, columns=MUSIC_ITEM_COLUMNS, 
+                row_to_dict=music_item_row_to_dict)).get_data()
+
+    ok = True
+    for debug in (False, True):
+        app.debug = debug
+        with app.test_request_context('/music/default'):
+            same = orm_path() == fast_path()
+            ok = ok and same
+            orm = min(timeit.repeat(orm_path, number=args.repeat, repeat=3))
+            fast = min(timeit.repeat(fast_path, number=args.repeat, repeat=3))
+            db.session.remove()
+        print('{:<8} orm {:7.3f} ms  fast {:7.3f} ms  speedup {:4.2f}x  identical {}'.format(
+                'pretty' if debug else 'compact', 
+                orm / args.repeat * 1000, fast / args.repeat * 1000, orm / fast, same))
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Mixed read/write throughput on SQLite with and without the engine tuning.
+
+Runs the same traffic against two fresh database files: one with
+Flask-SQLAlchemy's defaults (no pool, rollback journal, no pragmas) and one
+with the DATABASE_POOL_* / SQLITE_* settings from config. Each thread logs in
+as its own user and issues reads (catalog, home feed, pinned list) with
+pin/unpin and private item writes mixed in.
+
+    $ python -m benchmarks.sqlite_concurrency --threads 16 --seconds 10 --write-ratio 0.2
+"""
+import argparse
+import threading
+import time
+from argparse import Namespace
+from benchmarks.common import make_app
+from benchmarks.load_test import Worker, percentile, seed
+
+PROFILES = [
+    ('default', {'DATABASE_POOL_SIZE': 0, 'SQLITE_JOURNAL_MODE': '',
+                 'SQLITE_SYNCHRONOUS': '', 'SQLITE_BUSY_TIMEOUT': 0,
+                 'SQLITE_MMAP_SIZE': 0, 'SQLITE_CACHE_SIZE': 0}),
+    ('tuned', {}),
+]
+
+
+def reads(worker):
+    choice = worker.rng.random()
+    if choice < 0.5:
+        return worker.client.get('/music/default?page={}&per_page=20'.format(
+            worker.rng.randint(1, 50)))
+    if choice < 0.8:
+        return worker.client.get('/music/home?page={}'.format(
+            worker.rng.randint(1, 10)), headers=worker.auth)
+    return worker.client.get('/music/pinned', headers=worker.auth)
+
+
+def writes(worker):
+    choice = worker.rng.random()
+    if choice < 0.8:
+        method = worker.client.post if choice < 0.4 else worker.client.delete
+        return method('/music/pinned/{}'.format(worker.item()), headers=worker.auth)
+    return worker.client.post('/music/private', headers=worker.auth, json={
+        'resource_type': 'youtube',
+        'resource_id': 'bench-{}-{}'.format(worker.index, next(worker.counter))})
+
+
+def run(workers, seconds, write_ratio):
+    timings = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def drive(worker):
+        local = {'read': [], 'write': []}
+        local_errors = {'read': 0, 'write': 0}
+        while time.perf_counter() < deadline:
+            kind = 'write' if worker.rng.random() < write_ratio else 'read'
+            start = time.perf_counter()
+            response = (writes if kind == 'write' else reads)(worker)
+            response.get_data()
+            local[kind].append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                local_errors[kind] += 1
+        with lock:
+            for kind in timings:
+                timings[kind].extend(local[kind])
+                errors[kind] += local_errors[kind]
+
+    threads = [threading.Thread(target=drive, args=(worker,)) for worker in workers]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    for values in timings.values():
+        values.sort()
+    return timings, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    seed_args = Namespace(items=args.items, users=args.threads, pins_per_user=50,
+                          tokens_per_user=0, playlist_items=0, listens_per_user=0,
+                          seed=args.seed)
+    print('{:<8} {:>9} {:>8} {:>12} {:>12} {:>13} {:>13}'.format(
+        'profile', 'req/s', 'errors', 'read p50 ms', 'read p95 ms',
+        'write p50 ms', 'write p95 ms'))
+    throughput = {}
+    for name, overrides in PROFILES:
+        # response caching would hide the database from the read path
+        app = make_app(RESPONSE_CACHE_TTL=0, **overrides)
+        _, item_ids = seed(app, seed_args)
+        workers = [Worker(app, index, item_ids, args.seed) for index in range(args.threads)]
+        timings, errors, elapsed = run(workers, args.seconds, args.write_ratio)
+        total = len(timings['read']) + len(timings['write'])
+        throughput[name] = total / elapsed
+        print('{:<8} {:>9.1f} {:>8} {:>12.2f} {:>12.2f} {:>13.2f} {:>13.2f}'.format(
+            name, throughput[name], errors['read'] + errors['write'],
+            percentile(timings['read'], 0.50) * 1000,
+            percentile(timings['read'], 0.95) * 1000,
+            percentile(timings['write'], 0.50) * 1000,
+            percentile(timings['write'], 0.95) * 1000))
+    print('tuned / default throughput: {:.2f}x'.format(
+        throughput['tuned'] / throughput['default']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""Reports the number of SQL statements issued by each token endpoint.
+
+    $ python -m benchmarks.token_queries
+"""
+from benchmarks.common import (make_app, basic_auth_header, bearer_header, 
+                               QueryCounter)
+
+
+def main():
+    from app import db, token_cache
+    app = make_app()
+    client = app.test_client()
+    client.post('/users', json={'email': 'bench@example.com', 'password': 'pw'})
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+    basic = basic_auth_header('bench@example.com', 'pw')
+
+    def measure(label, method, url, headers):
+        # cold token cache so authentication is counted as well
+        token_cache.clear()
+        with counter.counting():
+            response = getattr(client, method)(url, headers=headers)
+        print('{:<32} {:>4} {:>3} queries'.format(
+                label, response.status_code, counter.count))
+        return response
+
+    tokens = measure('POST /tokens (first login)', 'post', '/tokens', basic).json
+    tokens = measure('POST /tokens (live tokens)', 'post', '/tokens', basic).json
+    tokens = measure('POST /tokens/refresh', 'post', '/tokens/refresh', 
+                     bearer_header(tokens['refresh_token'])).json
+    measure('DELETE /tokens', 'delete', '/tokens', 
+            bearer_header(tokens['access_token']))
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,8 @@
-from .seed_command import SeedCommand
\ No newline at end of file
+from .seed_command import SeedCommand
+from .purge_tokens_command import PurgeTokensCommand
+from .import_command import ImportCommand
+from .export_command import ExportCommand
+from .trending_command import TrendingCommand
+from .similarity_command import SimilarityCommand
+from .rebalance_playlists_command import RebalancePlaylistsCommand
+from .rollup_listens_command import RollupListensCommand
\ No newline at end of file
@@ -0,0 +1,23 @@
+import sys
+from app.catalog import export_query, export_music_items
+from flask_script import Command, Option
+
+class ExportCommand(Command):
+
+    option_list = (
+        Option('--out', '-o', dest='out', default=None),
+        Option('--list', '-l', dest='list_name', 
+               choices=('catalog', 'pinned', 'private'), default='catalog'),
+        Option('--user-id', '-u', dest='user_id', type=int, default=None),
+        Option('--batch-size', '-b', dest='batch_size', type=int, default=1000),
+    )
+
+    def run(self, out, list_name, user_id, batch_size):
+        query = export_query(list_name, user_id)
+        f = open(out, 'w', encoding='utf8') if out else sys.stdout
+        try:
+            for line in export_music_items(query, batch_size=batch_size):
+                f.write(line)
+        finally:
+            if out:
+                f.close()
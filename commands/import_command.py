@@ -0,0 +1,26 @@
+from app.catalog import read_music_rows, import_music_items
+from flask_script import Command, Option
+
+class ImportCommand(Command):
+
+    option_list = (
+        Option('path'),
+        Option('--format', '-f', dest='format', choices=('jsonl', 'csv'), 
+               default=None),
+        Option('--chunk-size', '-c', dest='chunk_size', type=int, default=1000),
+        Option('--on-conflict', dest='on_conflict', choices=('skip', 'update'), 
+               default='skip'),
+    )
+
+    def run(self, path, format, chunk_size, on_conflict):
+        stats = import_music_items(read_music_rows(path, format), 
+                                   chunk_size=chunk_size, 
+                                   on_conflict=on_conflict, 
+                                   progress=self.report)
+        print('Done: {read} read, {inserted} inserted, {updated} updated, '
+              '{skipped} skipped, {invalid} invalid in {elapsed:.1f}s'.format(**stats))
+
+    @staticmethod
+    def report(stats):
+        rate = stats['read'] / stats['elapsed'] if stats['elapsed'] else 0
+        print('{read} rows read ({rate:.0f} rows/s)'.format(rate=rate, **stats))
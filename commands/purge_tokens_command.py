@@ -0,0 +1,17 @@
+import time
+from app.models import UserToken 
+from flask_script import Command, Option
+
+class PurgeTokensCommand(Command):
+
+    option_list = (
+        Option('--batch-size', '-b', dest='batch_size', type=int, default=1000),
+        Option('--max-batches', '-m', dest='max_batches', type=int, default=None),
+    )
+
+    def run(self, batch_size, max_batches):
+        start = time.time()
+        purged = UserToken.purge_expired(batch_size=batch_size, 
+                                         max_batches=max_batches)
+        print('Purged {} expired tokens in {:.2f}s'.format(
+                purged, time.time() - start))
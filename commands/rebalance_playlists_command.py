@@ -0,0 +1,27 @@
+import time
+from app import db
+from app.models import Playlist
+from flask_script import Command, Option
+
+class RebalancePlaylistsCommand(Command):
+
+    option_list = (
+        Option('--id', dest='playlist_id', type=int, default=None,
+               help='rebalance this playlist whether flagged or not'),
+        Option('--max-playlists', '-m', dest='max_playlists', type=int, default=None),
+    )
+
+    def run(self, playlist_id, max_playlists):
+        start = time.time()
+        if playlist_id is not None:
+            playlist = Playlist.query.get(playlist_id)
+            if playlist is None:
+                print('Playlist {} not found'.format(playlist_id))
+                return
+            items = playlist.rebalance()
+            db.session.commit()
+            print('Rebalanced {} items in {:.2f}s'.format(items, time.time() - start))
+            return
+        rebalanced = Playlist.rebalance_flagged(max_playlists=max_playlists)
+        print('Rebalanced {} playlists in {:.2f}s'.format(
+                rebalanced, time.time() - start))
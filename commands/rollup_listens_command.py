@@ -0,0 +1,18 @@
+import time
+from flask import current_app
+from app.listens import rollup_listen_events
+from flask_script import Command, Option
+
+class RollupListensCommand(Command):
+
+    option_list = (
+        Option('--batch-size', '-b', dest='batch_size', type=int, default=None,
+               help='events per transaction, defaults to LISTEN_ROLLUP_BATCH_SIZE'),
+    )
+
+    def run(self, batch_size):
+        start = time.time()
+        rolled_up = rollup_listen_events(
+                batch_size=batch_size or current_app.config['LISTEN_ROLLUP_BATCH_SIZE'])
+        print('Rolled up {} listen events in {:.2f}s'.format(
+                rolled_up, time.time() - start))
@@ -1,5 +1,4 @@
-from app import db 
-from app.models import MusicItem 
+from app.catalog import import_music_items
 from flask_script import Command
 
 class SeedCommand(Command):
@@ -17,9 +16,5 @@ class SeedCommand(Command):
             {'resource_type': 'youtube', 'resource_id': 'waqxrK-EFI0'}
         ]
 
-        for item in music:
-            mi = MusicItem()
-            mi.from_dict(item)
-            db.session.add(mi)
-
-        db.session.commit()
\ No newline at end of file
+        import_music_items(dict(item, listen_count=None, private=False) 
+                           for item in music)
@@ -0,0 +1,26 @@
+import time
+from flask import current_app
+from app.similarity import build_similarity
+from flask_script import Command, Option
+
+class SimilarityCommand(Command):
+
+    option_list = (
+        Option('--top-k', '-k', dest='top_k', type=int, default=None,
+               help='neighbours kept per item, defaults to SIMILARITY_TOP_K'),
+        Option('--chunk-size', '-c', dest='chunk_size', type=int, default=None,
+               help='items per chunk, defaults to SIMILARITY_CHUNK_SIZE'),
+    )
+
+    def run(self, top_k, chunk_size):
+        config = current_app.config
+        start = time.time()
+        written = build_similarity(
+                top_k=top_k or config['SIMILARITY_TOP_K'],
+                chunk_size=chunk_size or config['SIMILARITY_CHUNK_SIZE'],
+                progress=self.report)
+        print('Done: {} similarity rows in {:.1f}s'.format(written, time.time() - start))
+
+    @staticmethod
+    def report(done, total, written):
+        print('{}/{} items, {} rows'.format(done, total, written))
@@ -0,0 +1,23 @@
+import time
+from flask import current_app
+from app.trending import update_trending
+from flask_script import Command, Option
+
+class TrendingCommand(Command):
+
+    option_list = (
+        Option('--half-life', dest='half_life', type=int, default=None,
+               help='seconds, defaults to TRENDING_HALF_LIFE'),
+        Option('--batch-size', '-b', dest='batch_size', type=int, default=None),
+    )
+
+    def run(self, half_life, batch_size):
+        config = current_app.config
+        start = time.time()
+        updated = update_trending(
+                half_life=half_life or config['TRENDING_HALF_LIFE'],
+                listen_weight=config['TRENDING_LISTEN_WEIGHT'],
+                pin_weight=config['TRENDING_PIN_WEIGHT'],
+                batch_size=batch_size or config['TRENDING_BATCH_SIZE'])
+        print('Updated trending scores of {} items in {:.2f}s'.format(
+                updated, time.time() - start))
@@ -1,7 +1,134 @@
 import os
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+# placeholder for development, create_app refuses it for signed access tokens
+DEFAULT_SECRET_KEY = 'you-will-never-guess'
+
 class Config(object):
+    SECRET_KEY = os.environ.get('SECRET_KEY') or DEFAULT_SECRET_KEY
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # connection pool, DATABASE_POOL_SIZE = 0 keeps Flask-SQLAlchemy's defaults
+    # (no pooling for SQLite files). Pre-ping and recycle only apply to servers
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE') or 10)
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW') or 20)
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT') or 30)
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE') or 1800)
+    DATABASE_POOL_PRE_PING = os.environ.get('DATABASE_POOL_PRE_PING', 'true').lower() in ('1', 'true')
+
+    # read replicas for read-only GET endpoints, comma separated. After a write
+    # the user's reads stay on the primary for REPLICA_STICKY_SECONDS
+    REPLICA_DATABASE_URIS = [uri.strip() for uri in
+        (os.environ.get('REPLICA_DATABASE_URLS') or '').split(',') if uri.strip()]
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS') or 5)
+    # where those windows are kept. 'sqlite' shares them between the worker
+    # processes on a host through a local file, 'memory' is per process and
+    # only holds with a single worker. Across hosts the load balancer has to
+    # keep a user on one host
+    REPLICA_STICKY_BACKEND = os.environ.get('REPLICA_STICKY_BACKEND') or 'sqlite'
+    REPLICA_STICKY_PATH = os.environ.get('REPLICA_STICKY_PATH') or \
+        os.path.join(basedir, 'replica_sticky.db')
+
+    # pragmas applied to every SQLite connection, empty or 0 leaves the default.
+    # WAL lets readers run alongside the single writer instead of blocking
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    # KiB of page cache per connection
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE') or 16 * 1024)
+
+    # verified token cache, entries never outlive the token itself
+    TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE') or 4096)
+    TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL') or 60)
+
+    # 'opaque' access tokens are stored in user_token, 'signed' access tokens
+    # are HMAC signed payloads verified without a database lookup and need a
+    # SECRET_KEY of your own
+    ACCESS_TOKEN_FORMAT = os.environ.get('ACCESS_TOKEN_FORMAT') or 'opaque'
+
+    # seconds between in-process purges of expired tokens, 0 disables
+    TOKEN_PURGE_INTERVAL = int(os.environ.get('TOKEN_PURGE_INTERVAL') or 0)
+    TOKEN_PURGE_BATCH_SIZE = int(os.environ.get('TOKEN_PURGE_BATCH_SIZE') or 1000)
+
+    # seconds the music catalog total used by list _meta may be stale
+    CATALOG_COUNT_TTL = int(os.environ.get('CATALOG_COUNT_TTL') or 30)
+
+    # sort=trending on /music/default. Listens and pins lose half their weight
+    # every TRENDING_HALF_LIFE seconds. Scores are updated by `manage.py
+    # update_trending` or every TRENDING_INTERVAL seconds in process, 0 disables
+    TRENDING_HALF_LIFE = int(os.environ.get('TRENDING_HALF_LIFE') or 24 * 3600)
+    TRENDING_LISTEN_WEIGHT = float(os.environ.get('TRENDING_LISTEN_WEIGHT') or 1.0)
+    TRENDING_PIN_WEIGHT = float(os.environ.get('TRENDING_PIN_WEIGHT') or 5.0)
+    TRENDING_INTERVAL = int(os.environ.get('TRENDING_INTERVAL') or 0)
+    TRENDING_BATCH_SIZE = int(os.environ.get('TRENDING_BATCH_SIZE') or 1000)
+
+    # item similarity from co-pins, rebuilt by `manage.py build_similarity`
+    # (needs numpy and scipy). /music/home?sort=recommended lists the user's
+    # HOME_RECOMMENDATIONS best recommendations first
+    SIMILARITY_TOP_K = int(os.environ.get('SIMILARITY_TOP_K') or 20)
+    SIMILARITY_CHUNK_SIZE = int(os.environ.get('SIMILARITY_CHUNK_SIZE') or 1000)
+    HOME_RECOMMENDATIONS = int(os.environ.get('HOME_RECOMMENDATIONS') or 100)
+
+    # playlists whose rank keys grew past PLAYLIST_RANK_MAX_LENGTH characters
+    # are respaced by `manage.py rebalance_playlists` or every
+    # PLAYLIST_REBALANCE_INTERVAL seconds in process, 0 disables
+    MAX_PLAYLIST_ITEMS = int(os.environ.get('MAX_PLAYLIST_ITEMS') or 10000)
+    PLAYLIST_RANK_MAX_LENGTH = int(os.environ.get('PLAYLIST_RANK_MAX_LENGTH') or 24)
+    PLAYLIST_REBALANCE_INTERVAL = int(os.environ.get('PLAYLIST_REBALANCE_INTERVAL') or 0)
+
+    # cache of serialized anonymous responses (/music/default). 'memory' is per
+    # process, 'sqlite' shares entries between workers through a local file.
+    # RESPONSE_CACHE_TTL = 0 disables the cache
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND') or 'memory'
+    RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH') or \
+        os.path.join(basedir, 'response_cache.db')
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL') or 30)
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE') or 512)
+    # pin/listen count changes tolerated before the whole cache is dropped
+    RESPONSE_CACHE_CHANGE_THRESHOLD = int(
+        os.environ.get('RESPONSE_CACHE_CHANGE_THRESHOLD') or 50)
+
+    # per-user materialized head of /music/home, HOME_FEED_CACHE_TTL = 0 disables
+    HOME_FEED_CACHE_TTL = int(os.environ.get('HOME_FEED_CACHE_TTL') or 0)
+    HOME_FEED_CACHE_SIZE = int(os.environ.get('HOME_FEED_CACHE_SIZE') or 1024)
+    HOME_FEED_CACHE_DEPTH = int(os.environ.get('HOME_FEED_CACHE_DEPTH') or 200)
+
+    # listen counts are buffered and written in batches, whichever comes first.
+    # Plays past LISTEN_BUFFER_MAX buffered (the database is down) are dropped
+    LISTEN_FLUSH_SIZE = int(os.environ.get('LISTEN_FLUSH_SIZE') or 1000)
+    LISTEN_FLUSH_INTERVAL = int(os.environ.get('LISTEN_FLUSH_INTERVAL') or 5)
+    LISTEN_BUFFER_MAX = int(os.environ.get('LISTEN_BUFFER_MAX') or 100000)
+    MAX_LISTEN_BATCH = int(os.environ.get('MAX_LISTEN_BATCH') or 500)
+
+    # listen events (POST /music/listens/events) are folded into hourly rollups
+    # by `manage.py rollup_listens` or every LISTEN_ROLLUP_INTERVAL seconds in
+    # process, 0 disables. /stats endpoints only read the rollups
+    MAX_LISTEN_DURATION = int(os.environ.get('MAX_LISTEN_DURATION') or 24 * 3600)
+    LISTEN_ROLLUP_INTERVAL = int(os.environ.get('LISTEN_ROLLUP_INTERVAL') or 0)
+    LISTEN_ROLLUP_BATCH_SIZE = int(os.environ.get('LISTEN_ROLLUP_BATCH_SIZE') or 5000)
+    MAX_STATS_DAYS = int(os.environ.get('MAX_STATS_DAYS') or 90)
+
+    # largest id list accepted by the batch pin/unpin and multi-get endpoints
+    MAX_MUSIC_BATCH = int(os.environ.get('MAX_MUSIC_BATCH') or 100)
+
+    # gzip (or brotli, if the brotli package is installed) for JSON responses of
+    # at least COMPRESSION_MIN_SIZE bytes, 0 disables compression
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE') or 1024)
+    COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL') or 6)
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY') or 5)
+
+    # adds a Server-Timing header with db time and query count to responses,
+    # except streamed ones whose headers are sent before the body runs
+    METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', '').lower() in ('1', 'true')
+
+    # file logging outside debug mode, written by a background thread. Records
+    # beyond LOG_QUEUE_SIZE waiting to be written are dropped and counted
+    LOG_DIR = os.environ.get('LOG_DIR') or 'logs'
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES') or 10 * 1024 * 1024)
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT') or 10)
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE') or 10000)
+    # one JSON line per request in access.log: route, status, latency, queries
+    ACCESS_LOG = os.environ.get('ACCESS_LOG', 'true').lower() in ('1', 'true')
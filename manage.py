@@ -2,12 +2,26 @@ from flask_script import Manager
 
 from app import create_app, db 
 from commands.seed_command import SeedCommand
+from commands.purge_tokens_command import PurgeTokensCommand
+from commands.import_command import ImportCommand
+from commands.export_command import ExportCommand
+from commands.trending_command import TrendingCommand
+from commands.similarity_command import SimilarityCommand
+from commands.rebalance_playlists_command import RebalancePlaylistsCommand
+from commands.rollup_listens_command import RollupListensCommand
 
 app = create_app()
 
 manager = Manager(app)
 app.app_context().push()
 manager.add_command('seed_db', SeedCommand)
+manager.add_command('purge_tokens', PurgeTokensCommand)
+manager.add_command('import_music', ImportCommand)
+manager.add_command('export_music', ExportCommand)
+manager.add_command('update_trending', TrendingCommand)
+manager.add_command('build_similarity', SimilarityCommand)
+manager.add_command('rebalance_playlists', RebalancePlaylistsCommand)
+manager.add_command('rollup_listens', RollupListensCommand)
 
 if __name__ == "__main__":
     manager.run()